@@ -281,11 +281,46 @@ MOVES_API = {
     'client_id': env('CLIENT_ID'),
     'client_secret': env('CLIENT_SECRET'),
     'api_auth': env('API_AUTH'),
-    'api': env('API')
+    'api': env('API'),
+    # days requested per storyline call, the API allows at most 7 days with trackPoints
+    'import_window_days': env.int('MOVES_IMPORT_WINDOW_DAYS', default=7),
+    # concurrent API requests of one import
+    'import_workers': env.int('MOVES_IMPORT_WORKERS', default=4),
+    # seconds without progress after which an import job counts as crashed and can be resumed
+    'import_job_stale_after': env.int('MOVES_IMPORT_JOB_STALE_AFTER', default=600),
+    # seconds between heartbeats of an import waiting for the API, well below import_job_stale_after
+    'import_heartbeat_interval': 60,
+    # minimum seconds between two progress events of an import sent to the user's websockets
+    'import_progress_interval': 1,
+    # per user request limits of the API
+    'rate_limit_minute': env.int('MOVES_RATE_LIMIT_MINUTE', default=60),
+    'rate_limit_hour': env.int('MOVES_RATE_LIMIT_HOUR', default=2000),
+    # retries of failed API requests (exponential backoff with jitter)
+    'max_attempts': env.int('MOVES_MAX_ATTEMPTS', default=6),
+    'retry_deadline': env.int('MOVES_RETRY_DEADLINE', default=300),
+    'retry_base_delay': 1,
+    'retry_max_delay': 60,
+    # cache known token validity, refresh tokens in the background this long before they expire
+    'token_cache_timeout': 60 * 60,
+    'token_refresh_ahead': 7 * 24 * 60 * 60,
 }
 
+# Pooled HTTP client for outbound API calls (MOVES, DarkSky)
+HTTP_CLIENT = {
+    # keep-alive connections per host, should cover MOVES_IMPORT_WORKERS
+    'pool_size': env.int('HTTP_POOL_SIZE', default=10),
+    'connect_timeout': 5,
+    'read_timeout': 30,
+}
+
+# Worker processes rendering the matplotlib charts, 0 renders inside the web process
+CHART_RENDER_WORKERS = env.int('CHART_RENDER_WORKERS', default=2)
+CHART_RENDER_TIMEOUT = 30
+
 DARKSKY_API = {
-    'api': 'https://api.darksky.net/forecast/f63cd475635eb732eb81572107b7dd78'
+    'api': 'https://api.darksky.net/forecast/f63cd475635eb732eb81572107b7dd78',
+    # fetch the weather of imported activities in the background, so detail pages find it cached
+    'prefetch': env.bool('DARKSKY_PREFETCH', default=False),
 }
 
 # In settings.py
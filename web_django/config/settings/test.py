@@ -42,6 +42,17 @@ CACHES = {
 # ------------------------------------------------------------------------------
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 
+# render charts inside the test process
+CHART_RENDER_WORKERS = 0
+
+# no redis for the channel layer in tests
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'asgiref.inmemory.ChannelLayer',
+        'ROUTING': 'django_playground.users.urls.channel_routing',
+    },
+}
+
 
 # PASSWORD HASHING
 # ------------------------------------------------------------------------------
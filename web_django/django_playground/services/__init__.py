@@ -1,5 +1,18 @@
-from .moves import MovesService
+from .charts import ChartService
+from .moves import MovesApiError, MovesAuthError, MovesService
+from .tiles import TileService
+from .tracks import TrackService
 from .utils import UtilsService
+from .weather import WeatherService
 
+__all__ = [
+    'MovesApiError', 'MovesAuthError',
+    'chart_service', 'moves_service', 'tile_service', 'track_service', 'utils_service', 'weather_service',
+]
+
+chart_service = ChartService()
 moves_service = MovesService()
+tile_service = TileService()
+track_service = TrackService()
 utils_service = UtilsService()
+weather_service = WeatherService()
@@ -0,0 +1,233 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+import threading
+
+from django.conf import settings
+from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+from matplotlib.figure import Figure
+import numpy as np
+
+from .utils import UtilsService
+
+utils_service = UtilsService()
+
+
+def svg_bytes(fig):
+    canvas = FigureCanvas(fig)
+    svg = BytesIO()
+    canvas.print_figure(svg, format='svg')
+    return svg.getvalue()
+
+
+def render_recent(series):
+    """Line chart of daily distances per activity."""
+    fig = Figure()
+    fig.patch.set_alpha(0)
+    ax = fig.add_subplot(111)
+
+    for line in series:
+        dates = [utils_service.make_date_from(day) for day in line['dates']]
+        ax.plot(dates, line['distances'], 'o-', color=line['color'], label=line['activity'])
+
+    ax.set_title("Recent Activities", color='white', fontweight='bold')
+    ax.set_xlabel('Date', labelpad=10, color='white', fontweight='bold')
+    ax.set_ylabel('Distances (m)', labelpad=10, color='white', fontweight='bold')
+
+    # ticks and labels in white
+    ax.tick_params('both', colors='white', labelsize=10)
+    ax.tick_params('x', labelrotation=33)
+
+    # misc settings
+    fig.subplots_adjust(bottom=0.2, left=0.15)
+    ax.grid(True, 'major', 'both', ls='--', lw=.5, c='w', alpha=.25)
+    ax.set_frame_on(False)
+    if series:
+        ax.legend()
+
+    return svg_bytes(fig)
+
+
+def render_speed(series):
+    """Speed over distance of one activity."""
+    fig = Figure(figsize=(9, 2), dpi=300)
+    fig.patch.set_alpha(0)
+    ax = fig.add_subplot(111)
+
+    # create some space around axis labels
+    fig.subplots_adjust(bottom=0.3, left=0.15)
+    ax.grid(True, 'major', 'both', ls='--', lw=.5, c='w', alpha=.25)
+    ax.set_frame_on(False)
+    ax.set_xlabel("Distance (m)", labelpad=10, color='w')
+    ax.set_ylabel("Velocity (km/h)", labelpad=10, color='w')
+    ax.tick_params('both', colors='w')
+
+    # create plot or name the shame (no sufficient data)
+    if series['distances']:
+        ax.plot(series['distances'], series['speeds'], '.-', color=series['color'])
+    else:
+        fig.text(.25, .5, 'Oops, not enough data for generating a plot :( ', style='normal',
+                 bbox={'facecolor': 'red', 'alpha': 0.5, 'pad': 10})
+
+    return svg_bytes(fig)
+
+
+def render_pie(distances):
+    """Pie chart of the distance per activity, with a hand drawn legend."""
+    fig = Figure(figsize=(3, 4))
+    fig.patch.set_alpha(0)
+    ax = fig.add_subplot(111)
+
+    parts = [part for part in distances if part['distance'] > 0]
+    whole = sum(part['distance'] for part in parts)
+
+    # draw the legend by hand, because display looks bad for small values
+    y = -1.5
+    for part in distances:
+        if part['distance'] > 0:
+            legend_activity = '{}: {}%'.format(part['activity'], round(part['distance'] / (whole / 100), 2))
+            ax.text(0.2, y, legend_activity, va='top', ha='right', rotation=0, wrap=True, color=part['color'])
+        y += 0.13
+
+    ax.pie([part['distance'] for part in parts], labels=None, autopct=None, shadow=True, startangle=90,
+           colors=[part['color'] for part in parts], center=(-0.8, 0))
+
+    fig.subplots_adjust(top=0.3, bottom=0.25)
+    ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+    fig.tight_layout()
+
+    return svg_bytes(fig)
+
+
+def warm_up(*args):
+    """Render a tiny figure so a pool worker has matplotlib and its font cache loaded."""
+    return len(render_pie([dict(activity='walking', distance=1, color='#00bc8c')]))
+
+
+class ChartService:
+    """Chart data and SVG rendering with matplotlib's object oriented API.
+
+    Figures never touch pyplot's global state, so rendering is thread-safe. With
+    CHART_RENDER_WORKERS > 0 the rendering runs in a pool of warmed up worker
+    processes, keeping matplotlib's CPU time out of the web process.
+    """
+
+    renderers = {
+        'recent': render_recent,
+        'speed': render_speed,
+        'pie': render_pie,
+    }
+
+    recent_activities = ['walking', 'running', 'cycling']
+
+    pie_activities = ['walking', 'cycling', 'running', 'transport']
+
+    def __init__(self):
+        self.pool = None
+        self.pool_lock = threading.Lock()
+
+    @property
+    def workers(self):
+        return getattr(settings, 'CHART_RENDER_WORKERS', 0)
+
+    def render(self, chart, data):
+        """SVG bytes of a chart, rendered in the worker pool if one is configured."""
+        renderer = self.renderers[chart]
+        if not self.workers:
+            return renderer(data)
+        try:
+            return self.get_pool().submit(renderer, data).result(timeout=getattr(settings, 'CHART_RENDER_TIMEOUT', 30))
+        except BrokenProcessPool:
+            with self.pool_lock:
+                self.pool = None
+            return renderer(data)
+
+    def get_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                list(self.pool.map(warm_up, range(self.workers)))
+            return self.pool
+
+    def recent_series(self, summary):
+        """Daily distances per activity, days without any activity count as 0."""
+        series = []
+        for activity in self.recent_activities:
+            daily_distance = {}
+            for day in summary:
+                if not day['summary']:
+                    daily_distance[day['date']] = 0
+                    continue
+                for element in day['summary']:
+                    if element['activity'] == activity:
+                        daily_distance[day['date']] = element['distance']
+
+            if daily_distance and sum(daily_distance.values()) > 0:
+                dates = sorted(daily_distance)
+                series.append(dict(
+                    activity=activity,
+                    color=utils_service.get_activity_color(activity),
+                    dates=dates,
+                    distances=[daily_distance[day] for day in dates]
+                ))
+        return series
+
+    def speed_series(self, activity):
+        """Speed (km/h) over the cumulated distance (m) of an activity's trackPoints."""
+        speed_by_distance = {}
+        distance = 0.0
+        for track_point in activity.get('trackPoints', []):
+            if track_point.get('distance') is not None:
+                distance += track_point['distance']
+                speed_by_distance[distance] = track_point.get('speed_kmh')
+
+        distances = sorted(speed_by_distance)
+        return dict(
+            activity=activity['activity'],
+            color=utils_service.get_activity_color(activity['activity']),
+            distances=distances,
+            speeds=[speed_by_distance[d] for d in distances]
+        )
+
+    def pie_distances(self, summary):
+        """Total distance per activity over all days of a summary."""
+        distances = []
+        for activity in self.pie_activities:
+            distance = 0
+            for day in summary:
+                for element in day['summary']:
+                    if element['activity'] == activity:
+                        distance += element['distance']
+            distances.append(dict(
+                activity=activity,
+                color=utils_service.get_activity_color(activity),
+                distance=distance
+            ))
+        return distances
+
+    def downsample(self, x, y, max_points):
+        """Reduce a line to at most `max_points` points with Largest-Triangle-Three-Buckets.
+
+        First and last point are kept, from every bucket in between the point spanning
+        the largest triangle with the previously selected point and the next bucket's
+        average, so peaks survive unlike with plain striding.
+        """
+        n = len(x)
+        if n <= max_points or max_points < 3:
+            return list(x), list(y)
+
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+        selected = [0]
+        for i in range(max_points - 2):
+            start, end = edges[i], edges[i + 1]
+            next_end = edges[i + 2] if i + 2 < len(edges) else n
+            avg_x = x[end:next_end].mean()
+            avg_y = y[end:next_end].mean()
+            a = selected[-1]
+            areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+            selected.append(start + int(np.argmax(areas)))
+        selected.append(n - 1)
+
+        return x[selected].tolist(), y[selected].tolist()
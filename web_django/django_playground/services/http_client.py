@@ -0,0 +1,41 @@
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+import requests
+
+import threading
+
+
+class HttpClient:
+    """Pooled keep-alive HTTP client shared by all outbound API calls.
+
+    requests.Session objects are not guaranteed to be thread-safe, so every
+    thread gets its own session; all of them share one HTTPAdapter, whose
+    urllib3 connection pools are. Connections are reused across requests and
+    threads instead of doing a new TCP+TLS handshake per call.
+    """
+
+    def __init__(self, pool_size=None, timeout=None):
+        config = getattr(settings, 'HTTP_CLIENT', {})
+        self.pool_size = pool_size or config.get('pool_size', 10)
+        self.timeout = timeout or (config.get('connect_timeout', 5), config.get('read_timeout', 30))
+        self.adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+            self.local.session = session
+        return session
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.post(url, **kwargs)
@@ -1,20 +1,46 @@
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
 import logging
 import requests
+from channels import Channel, Group
 
+import gzip
+import hashlib
 import json
-import sys
-import math
+import random
+import threading
 from datetime import datetime, timedelta
 import time
-from operator import itemgetter, attrgetter
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from email.utils import parsedate_to_datetime
+from operator import itemgetter
 from calendar import monthrange
 
+from ..users.models import ActivityTotal, DailyActivitySummary, DataPoint, DataProfile, ImportJob, Track
+from . import ratelimit, timestamps
+from .http_client import HttpClient
+from .tracks import TrackService
+from .utils import UtilsService
+from .weather import WeatherService
+
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
 
+class MovesApiError(Exception):
+    """A MOVES API request failed and retrying will not help."""
+
+
+class MovesAuthError(MovesApiError):
+    """The MOVES API rejected the credentials of a data profile."""
+
+
 class MovesService:
     """Service that offers Access to MOVES Api - https://dev.moves-app.com ."""
 
@@ -22,6 +48,34 @@ class MovesService:
 
     name = 'moves'
 
+    # maximum range of a storyline request including trackPoints
+    max_storyline_window_days = 7
+
+    # responses worth another attempt after a backoff
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    token_lock = threading.Lock()
+
+    tracks = TrackService()
+
+    utils = UtilsService()
+
+    weather = WeatherService()
+
+    http = HttpClient()
+
+    geojson_cache_timeout = 60 * 60 * 24 * 30
+
+    # loaded days, the detail page requests the same day from three views
+    day_cache_timeout = 60 * 5
+    day_memo_size = 16
+    day_memo = OrderedDict()
+    day_memo_lock = threading.Lock()
+
+    # summed up by ActivityTotal, always present in get_totals
+    totals_fields = ('duration', 'distance', 'steps', 'calories', 'count')
+    totals_activities = ['walking', 'cycling', 'transport']
+
     def is_user_authenticated(self, user):
         try:
             moves_profile = user.data_profiles.get(provider=self.name)
@@ -52,50 +106,90 @@ class MovesService:
                 filters += '{}={}&'.format(param, kwargs[param])
 
         url = '{}/user/{}/daily{}?{}'.format(self.config['api'], data_type, date, filters)
-        do_request = True
-        r = None
-        while do_request:
-            print('MOVES API Request: {}'.format(url))
-            r = requests.get(url, headers=self.get_headers(moves_profile))
-            print('MOVES API Response: {}'.format(r.status_code))
-            if r.status_code == 200:
-                do_request = False
-            else:
-                time.sleep(10)
+        r = self.request_with_retries(url, moves_profile)
 
         try:
             return r.json()
         except ValueError:
             raise ValueError('MOVES API Response did not contain JSON: {}'.format(r.text))
 
-    def get_data_points_month(self, user, date):
-        first_dat, num_days = monthrange(date.year, date.month)
-        moves_profile = user.data_profiles.get(provider=self.name)
-        to_date = date + timedelta(days=num_days)
-        data_points = moves_profile.data_points.filter(
-            date__gte=date,
-            date__lte=to_date
-        )
-        return self.transform_data_points(data_points)
+    def request_with_retries(self, url, moves_profile):
+        """GET an API url with exponential backoff.
+
+        Retryable failures (connection errors, 429 and 5xx) are retried with full
+        jitter or the delay the API asks for (Retry-After / rate limit headers),
+        within max_attempts and retry_deadline. A 401 refreshes the access token
+        once, any other status raises MovesApiError right away.
+        """
+        deadline = time.monotonic() + self.config.get('retry_deadline', 300)
+        max_attempts = self.config.get('max_attempts', 6)
+        token_refreshed = False
+        reason = None
+        attempt = 0
+        while attempt < max_attempts:
+            self.get_rate_limiter(moves_profile).acquire()
+            access_token = moves_profile.auth_data['access_token']
+            r = None
+            try:
+                print('MOVES API Request: {}'.format(url))
+                r = self.http.get(url, headers=self.get_headers(moves_profile))
+                print('MOVES API Response: {}'.format(r.status_code))
+            except requests.RequestException as e:
+                reason = e
+            if r is not None:
+                if r.status_code == 200:
+                    return r
+                reason = 'status {}'.format(r.status_code)
+                if r.status_code == 401:
+                    if token_refreshed:
+                        raise MovesAuthError('MOVES API rejected the refreshed access token: {}'.format(url))
+                    self.refresh_expired_token(moves_profile, access_token)
+                    token_refreshed = True
+                    continue
+                if r.status_code not in self.retry_statuses:
+                    raise MovesApiError('MOVES API Request {} failed with {}: {}'.format(url, r.status_code, r.text))
+
+            attempt += 1
+            delay = self.retry_delay(attempt, r)
+            if attempt >= max_attempts or time.monotonic() + delay > deadline:
+                break
+            print('MOVES API Retry in {:.1f}s ({})'.format(delay, reason))
+            time.sleep(delay)
+
+        raise MovesApiError('MOVES API Request {} failed after {} attempts: {}'.format(url, attempt, reason))
+
+    def retry_delay(self, attempt, response=None):
+        """Seconds to wait before the next attempt."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return max(0, float(retry_after))
+                except ValueError:
+                    retry_at = parsedate_to_datetime(retry_after)
+                    return max(0, (retry_at - datetime.now(retry_at.tzinfo)).total_seconds())
+            if response.status_code == 429:
+                if response.headers.get('X-RateLimit-HourRemaining') == '0':
+                    return 60 * 60
+                if response.headers.get('X-RateLimit-MinuteRemaining') == '0':
+                    return 60
+        backoff = min(self.config.get('retry_max_delay', 60), self.config.get('retry_base_delay', 1) * 2 ** attempt)
+        return random.uniform(0, backoff)
 
-    def get_data_points_date(self, user, date):
+    def get_data_points_date(self, user, date, track_points=True):
         moves_profile = user.data_profiles.get(provider=self.name)
         data_points = moves_profile.data_points.filter(
             date=date
         )
-        return self.transform_data_points(data_points)
+        if not track_points:
+            data_points = data_points.without_track_points()
+        return self.transform_data_points(data_points, track_points=track_points)
 
-    def get_data_points_past_days(self, user, days_past):
-        moves_profile = user.data_profiles.get(provider=self.name)
-        to_date = moves_profile.data_points.latest('date').date
-        from_date = to_date - timedelta(days=days_past)
-        data_points = moves_profile.data_points.filter(
-            date__gte=from_date,
-            date__lte=to_date
-        ).order_by('date')
-        return self.transform_data_points(data_points)
+    def transform_data_points(self, data_points, track_points=True):
+        data_points = list(data_points)
+        if track_points:
+            self.attach_track_points(data_points)
 
-    def transform_data_points(self, data_points):
         data_by_day = dict()
         for p in data_points:
             if p.date not in data_by_day:
@@ -104,10 +198,11 @@ class MovesService:
                     segments=[]
                 )
 
-            if p.type == 'move':
-                p.data = self.calculate_distances(p.data)
+            segment = p.segment
+            if p.type == 'move' and track_points and p.metrics_version != self.tracks.version:
+                segment = self.calculate_distances(segment)
 
-            data_by_day[p.date]['segments'].append(p.data)
+            data_by_day[p.date]['segments'].append(segment)
 
         response = []
         for day in data_by_day:
@@ -115,66 +210,137 @@ class MovesService:
             response.append(data_by_day[day])
         return sorted(response, key=itemgetter("date"), reverse=True)
 
+    def iter_segments(self, moves_profile, from_date, to_date):
+        """Segments from from_date to to_date (inclusive) in date order, loaded one day at a time."""
+        data_points = moves_profile.data_points.in_range(from_date, to_date)
+        for day in data_points.order_by('date').values_list('date', flat=True).distinct():
+            data_points = list(moves_profile.data_points.filter(date=day).order_by('id'))
+            self.attach_track_points(data_points)
+            for p in data_points:
+                segment = p.segment
+                if p.type == 'move' and p.metrics_version != self.tracks.version:
+                    segment = self.calculate_distances(segment)
+                yield segment
+
+    def attach_track_points(self, data_points):
+        """Put the trackPoints of the stored Tracks back into the activities of move DataPoints.
+
+        Activities without a Track get an empty list, like the API sends them.
+        """
+        moves = dict((p.id, p) for p in data_points if p.type == 'move')
+        if not moves:
+            return
+        for p in moves.values():
+            for activity in p.segment.get('activities', []):
+                activity.setdefault('trackPoints', [])
+        for track in Track.objects.filter(data_point_id__in=moves):
+            activities = moves[track.data_point_id].segment.get('activities', [])
+            if track.position < len(activities):
+                activities[track.position]['trackPoints'] = self.tracks.track_points(*self.tracks.unpack(track))
+
+    def split_track_points(self, segment):
+        """The segment without trackPoints and a list of (position, activity, trackPoints) to pack."""
+        if 'activities' not in segment:
+            return segment, []
+        tracks = []
+        activities = []
+        for position, activity in enumerate(segment['activities']):
+            activity = dict(activity)
+            track_points = activity.pop('trackPoints', None)
+            if track_points:
+                tracks.append((position, activity.get('activity', ''), track_points))
+            activities.append(activity)
+        return dict(segment, activities=activities), tracks
+
+    def day_version(self, moves_profile, date):
+        """Version of the stored data of a day, derived from the keys of its segment versions.
+
+        A re-import that changes the day changes the segment keys and therefore the
+        version, so cache entries keyed by it are never outdated.
+        """
+        segment_keys = sorted(
+            key or '' for key in moves_profile.data_points.filter(date=date).values_list('key', flat=True)
+        )
+        return hashlib.sha1(repr([self.tracks.version, segment_keys]).encode('utf-8')).hexdigest()
+
+    def load_day(self, moves_profile, date):
+        """Activities of a day with trackPoints, memoized in the process and shortly in the cache.
+
+        Treat the result as read-only, it is shared between requests.
+        """
+        key = 'day:{}:{}:{}'.format(moves_profile.id, date.isoformat(), self.day_version(moves_profile, date))
+        with self.day_memo_lock:
+            if key in self.day_memo:
+                self.day_memo.move_to_end(key)
+                return self.day_memo[key]
+
+        activities = cache.get(key)
+        if activities is None:
+            activities = self.day_activities(self.transform_data_points(moves_profile.data_points.filter(date=date)))
+            cache.set(key, activities, self.day_cache_timeout)
+
+        with self.day_memo_lock:
+            self.day_memo[key] = activities
+            while len(self.day_memo) > self.day_memo_size:
+                self.day_memo.popitem(last=False)
+        return activities
+
+    def day_geojson_key(self, moves_profile, date, simplify=None):
+        """Cache key of a day's GeoJSON, changes with the day's data version."""
+        parts = [
+            moves_profile.id, date.isoformat(), self.day_version(moves_profile, date), sorted((simplify or {}).items())
+        ]
+        return 'geojson:{}'.format(hashlib.sha1(repr(parts).encode('utf-8')).hexdigest())
+
+    def get_day_geojson(self, moves_profile, date, simplify=None, key=None):
+        """Gzip compressed GeoJSON FeatureCollection of a day and the time it was built, cached."""
+        key = key or self.day_geojson_key(moves_profile, date, simplify)
+        geojson = cache.get(key)
+        if geojson is None:
+            geojson = self.build_day_geojson(moves_profile, date, simplify)
+            cache.set(key, geojson, self.geojson_cache_timeout)
+        return geojson
+
+    def build_day_geojson(self, moves_profile, date, simplify=None):
+        features = self.utils.geojson_features(self.iter_segments(moves_profile, date, date), **(simplify or {}))
+        body = ''.join(self.utils.geojson_stream(features)).encode('utf-8')
+        return dict(body=gzip.compress(body), modified=int(time.time()))
+
     def calculate_distances(self, data_point):
-        # Haversine formula:a = sin²(Δφ/2) + cos φ1 ⋅ cos φ2 ⋅ sin²(Δλ/2)
-        # c = 2 ⋅ atan2( √a, √(1−a) )
-        # d = R ⋅ c
-        # where	φ is latitude, λ is longitude, R is earth’s radius (mean radius = 6,371km);
-        # note that angles need to be in radians to pass to trig functions!
-        R = 6371e3
+        """Add distance and speed to every trackPoint and max/avg speed to every activity."""
         if 'activities' in data_point:
             for activity in data_point['activities']:
-                max_speed = 0
-                avg_speed = 0
-                speed_iter = 0
-                if 'trackPoints' in activity:
-                    lastLat = None
-                    lastLon = None
-                    lastTime = None
-
-                    for track_point in activity['trackPoints']:
-                        if not lastLat and not lastLon:
-                            lastLat = track_point['lat']
-                            lastLon = track_point['lon']
-                            lastTime = self.create_date(track_point['time'])
-                        else:
-                            currentLat = track_point['lat']
-                            currentLon = track_point['lon']
-                            currentTime = self.create_date(track_point['time'])
-                            lat1Radians = math.radians(lastLat)
-                            lat2Radians = math.radians(currentLat)
-                            latDistance = math.radians(currentLat-lastLat)
-                            lonDistance = math.radians(currentLon-lastLon)
-
-                            a = math.sin(latDistance/2) * math.sin(latDistance/2) + math.cos(lat1Radians) * math.cos(lat2Radians) * math.sin(lonDistance/2) * math.sin(lonDistance/2)
-                            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-                            d = R * c
-
-                            seconds = (currentTime-lastTime).total_seconds()
-                            if seconds > 0:
-                                meters_per_second = d/seconds
-                                meters_per_hour = meters_per_second*60*60
-                                km_per_hour = meters_per_hour / 1000
-                                track_point['speed'] = meters_per_second
-                                track_point['speed_kmh'] = km_per_hour
-                                track_point['distance'] = d
-
-                                avg_speed += km_per_hour
-                                speed_iter += 1
-                                if km_per_hour > max_speed:
-                                    max_speed = km_per_hour
-
-                            lastLat = currentLat
-                            lastLon = currentLon
-                            lastTime = currentTime
-
-                if speed_iter > 0:
-                    avg_speed = avg_speed/speed_iter
-
-                activity['max_speed'] = max_speed
-                activity['avg_speed'] = avg_speed
+                self.tracks.calculate_activity(activity)
         return data_point
 
+    def recompute_metrics(self, moves_profile):
+        """Recalculate the stored move metrics of all DataPoints with an outdated version.
+
+        The daily summaries (and through them the totals) of the affected days are
+        rebuilt, their max_speed comes from the recalculated activities.
+        """
+        data_points = moves_profile.data_points.filter(type='move').exclude(metrics_version=self.tracks.version)
+        dates = set()
+        updated = 0
+        for data_point in data_points.iterator():
+            self.attach_track_points([data_point])
+            data_point.data = self.split_track_points(self.calculate_distances(data_point.data))[0]
+            data_point.metrics_version = self.tracks.version
+            data_point.save(update_fields=['data', 'metrics_version'])
+            dates.add(data_point.date)
+            updated += 1
+        for date in sorted(dates):
+            with transaction.atomic():
+                self.update_daily_summary(moves_profile, date)
+        if updated:
+            self.touch_imported_at(moves_profile)
+        return updated
+
+    def touch_imported_at(self, moves_profile):
+        """Mark the data of a profile as changed, cached charts are keyed by imported_at."""
+        moves_profile.imported_at = timezone.now()
+        moves_profile.save(update_fields=['imported_at'])
+
     def calculate_summary(self, segments):
         summary = {}
         for segment in segments:
@@ -185,54 +351,142 @@ class MovesService:
                             activity=activity['activity'],
                             group=activity['group'],
                             duration=activity['duration'],
-                            distance=activity['distance']
+                            distance=activity['distance'],
+                            count=1,
+                            max_speed=activity.get('max_speed', 0)
                         )
                         if 'steps' in activity:
                             summary[activity['activity']]['steps'] = activity['steps']
+                        if 'calories' in activity:
+                            summary[activity['activity']]['calories'] = activity['calories']
                     else:
-                        summary[activity['activity']]['duration'] += activity['duration']
-                        summary[activity['activity']]['distance'] += activity['distance']
+                        totals = summary[activity['activity']]
+                        totals['duration'] += activity['duration']
+                        totals['distance'] += activity['distance']
+                        totals['count'] += 1
+                        totals['max_speed'] = max(totals['max_speed'], activity.get('max_speed', 0))
                         if 'steps' in activity:
-                            summary[activity['activity']]['steps'] += activity['steps']
+                            totals['steps'] = totals.get('steps', 0) + activity['steps']
+                        if 'calories' in activity:
+                            totals['calories'] = totals.get('calories', 0) + activity['calories']
 
         response = []
         for activity_name in summary:
             response.append(summary[activity_name])
         return response
 
-    def calculate_totals(self, moves_profile, activities):
-        for activity in activities:
-            if 'totals' not in moves_profile.data:
-                moves_profile.data['totals'] = dict(
-                    walking=dict(
-                        calories=0,
-                        distance=0,
-                        duration=0,
-                        steps=0
-                    ),
-                    cycling=dict(
-                        calories=0,
-                        distance=0,
-                        duration=0,
-                    ),
-                    transport=dict(
-                        distance=0,
-                        duration=0,
-                    )
-                )
-            moves_profile.data['totals'][activity['activity']]['distance'] += int(activity['distance'])
-            moves_profile.data['totals'][activity['activity']]['duration'] += int(activity['duration'])
+    def get_totals(self, moves_profile, period=ActivityTotal.TOTAL, start=ActivityTotal.TOTAL_START):
+        """Totals per activity of one period, activities without any data count as 0."""
+        totals = dict((activity, dict(dict.fromkeys(self.totals_fields, 0), activity=activity, max_speed=0))
+                      for activity in self.totals_activities)
+        for total in moves_profile.activity_totals.filter(period=period, start=start):
+            totals[total.activity] = total.as_dict()
+        return totals
+
+    def get_rollups(self, moves_profile, period, from_date=None, to_date=None):
+        """Totals per period and activity, ordered by start, optionally limited to the periods starting in a range."""
+        totals = moves_profile.activity_totals.filter(period=period)
+        if from_date is not None:
+            totals = totals.filter(start__gte=from_date)
+        if to_date is not None:
+            totals = totals.filter(start__lte=to_date)
+        return [total.as_dict() for total in totals.order_by('start', 'activity')]
+
+    def get_year_overview(self, moves_profile, year):
+        """Totals of a year with its months and weeks, periods without data are left out."""
+        first_day = datetime(year, 1, 1).date()
+        last_day = datetime(year, 12, 31).date()
+
+        def by_start(rollups):
+            periods = OrderedDict()
+            for rollup in rollups:
+                periods.setdefault(rollup['start'], dict(start=rollup['start'], totals={}))
+                periods[rollup['start']]['totals'][rollup['activity']] = rollup
+            return list(periods.values())
+
+        return dict(
+            year=year,
+            totals=self.get_totals(moves_profile, ActivityTotal.YEAR, first_day),
+            months=by_start(self.get_rollups(moves_profile, ActivityTotal.MONTH, first_day, last_day)),
+            # the first week may start in december
+            weeks=by_start(
+                self.get_rollups(moves_profile, ActivityTotal.WEEK, first_day - timedelta(days=6), last_day)
+            ),
+        )
+
+    def get_rollup_years(self, moves_profile):
+        """Years with any totals, newest first."""
+        return [start.year for start in moves_profile.activity_totals.filter(
+            period=ActivityTotal.YEAR
+        ).order_by('-start').values_list('start', flat=True).distinct()]
+
+    def update_totals(self, moves_profile, date, old_summaries, new_summaries):
+        """Add the difference between the old and new summaries of a day to the totals of its periods.
 
-            if activity['activity'] == 'walking' or activity['activity'] == 'cycling':
-                moves_profile.data['totals'][activity['activity']]['calories'] += int(activity['calories'])
+        The new summaries have to be stored already: if the maximum speed of the
+        day decreased, the maximum of its periods is recomputed from them.
+        """
+        deltas = {}
+        old_max_speeds = dict((summary['activity'], summary.get('max_speed', 0)) for summary in old_summaries)
+        new_max_speeds = dict((summary['activity'], summary.get('max_speed', 0)) for summary in new_summaries)
+        for summaries, sign in ((old_summaries, -1), (new_summaries, 1)):
+            for summary in summaries:
+                delta = deltas.setdefault(summary['activity'], dict.fromkeys(self.totals_fields, 0))
+                for field in self.totals_fields:
+                    # rounded like the stored summaries, so re-imports don't drift
+                    delta[field] += sign * ActivityTotal._meta.get_field(field).to_python(summary.get(field, 0))
 
-            if activity['activity'] == 'walking':
-                moves_profile.data['totals'][activity['activity']]['steps'] += int(activity['steps'])
+        for activity, delta in deltas.items():
+            old_max_speed = old_max_speeds.get(activity, 0)
+            new_max_speed = new_max_speeds.get(activity, 0)
+            if not any(delta.values()) and old_max_speed == new_max_speed:
+                continue
+            for period, start in ActivityTotal.period_starts(date):
+                totals = moves_profile.activity_totals.filter(period=period, start=start, activity=activity)
+                changes = dict((field, F(field) + value) for field, value in delta.items())
+                if new_max_speed > old_max_speed:
+                    changes['max_speed'] = Greatest(F('max_speed'), new_max_speed, output_field=FloatField())
+                if not totals.update(**changes):
+                    try:
+                        with transaction.atomic():
+                            ActivityTotal.objects.create(data_profile=moves_profile, period=period, start=start,
+                                                         activity=activity, max_speed=new_max_speed, **delta)
+                    except IntegrityError:
+                        # created in the meantime
+                        totals.update(**changes)
+                if new_max_speed < old_max_speed:
+                    days = moves_profile.daily_summaries.filter(activity=activity, date__gte=start)
+                    end = ActivityTotal.period_end(period, start)
+                    if end is not None:
+                        days = days.filter(date__lt=end)
+                    totals.update(max_speed=days.aggregate(max_speed=Max('max_speed'))['max_speed'] or 0)
 
-    def get_activities_date(self, user, date):
-        data = self.get_storyline_date(user, date)
+    def rebuild_totals(self, moves_profile):
+        """Recompute all totals of a profile from its daily summaries."""
+        totals = {}
+        with transaction.atomic():
+            for summary in moves_profile.daily_summaries.iterator():
+                for period, start in ActivityTotal.period_starts(summary.date):
+                    total = totals.setdefault((period, start, summary.activity),
+                                              dict(dict.fromkeys(self.totals_fields, 0), max_speed=0))
+                    for field in self.totals_fields:
+                        total[field] += getattr(summary, field)
+                    total['max_speed'] = max(total['max_speed'], summary.max_speed)
+
+            moves_profile.activity_totals.all().delete()
+            ActivityTotal.objects.bulk_create([
+                ActivityTotal(data_profile=moves_profile, period=period, start=start, activity=activity, **total)
+                for (period, start, activity), total in totals.items()
+            ])
+            self.touch_imported_at(moves_profile)
+        return len(totals)
+
+    def get_activities_date(self, user, date, track_points=True):
+        return self.day_activities(self.get_storyline_date(user, date, track_points=track_points))
+
+    def day_activities(self, data):
         activities = []
-        if 'segments' in data[0]:
+        if data and 'segments' in data[0]:
             for segment in data[0]['segments']:
                 if 'activities' in segment:
                     for activity in segment['activities']:
@@ -240,85 +494,439 @@ class MovesService:
 
         return sorted(activities, key=itemgetter('startTime'))
 
-    def get_activity_date(self, user, date, index):
-        activity = self.get_activities_date(user, date)[index]
-        # get weather conditions based on first track point
-        if 'trackPoints' in activity and len(activity['trackPoints']) > 0:
-            time = self.create_date(activity['trackPoints'][0]['time'])
-            forecast_url = '{}/{},{},{}?units=auto'.format(settings.DARKSKY_API['api'], activity['trackPoints'][0]['lat'], activity['trackPoints'][0]['lon'], time.strftime('%s'))
-            response = requests.get(forecast_url).json()
-            activity['weather'] = response
+    def get_activity_date(self, user, date, index, weather=False):
+        moves_profile = user.data_profiles.get(provider=self.name)
+        # a copy, the loaded day is shared
+        activity = dict(self.load_day(moves_profile, date)[index])
+        if weather:
+            # weather conditions at the first track point, if already known
+            conditions = self.weather.get_activity_weather(activity)
+            if conditions is not None:
+                activity['weather'] = conditions
 
         return activity
 
     def get_summary_past_days(self, user, days_past):
-        return self.get_data_points_past_days(user, days_past=days_past)
+        moves_profile = user.data_profiles.get(provider=self.name)
+        to_date = moves_profile.data_points.latest_date()
+        if to_date is None:
+            return []
+        from_date = to_date - timedelta(days=days_past)
+        return self.get_summary_range(moves_profile, from_date, to_date)
 
     def get_summary_month(self, user, month_as_date):
-        return self.get_data_points_month(user, date=month_as_date)
+        first_day, num_days = monthrange(month_as_date.year, month_as_date.month)
+        moves_profile = user.data_profiles.get(provider=self.name)
+        to_date = month_as_date + timedelta(days=num_days)
+        return self.get_summary_range(moves_profile, month_as_date, to_date)
+
+    def get_summary_date(self, user, date):
+        moves_profile = user.data_profiles.get(provider=self.name)
+        return self.get_summary_range(moves_profile, date, date)
 
-    def get_storyline_date(self, user, date):
-        return self.get_data_points_date(user, date)
+    def get_summary_range(self, moves_profile, from_date, to_date):
+        """Daily summaries read from the DailyActivitySummary table, newest day first."""
+        days = moves_profile.data_points.in_range(
+            from_date, to_date
+        ).order_by().values_list('date', flat=True).distinct()
+
+        summary_by_day = dict()
+        for day in days:
+            summary_by_day[day] = dict(date=day.strftime('%Y%m%d'), summary=[])
+
+        summaries = moves_profile.daily_summaries.filter(
+            date__gte=from_date,
+            date__lte=to_date
+        ).order_by('date', 'id')
+        for summary in summaries:
+            if summary.date not in summary_by_day:
+                summary_by_day[summary.date] = dict(date=summary.date.strftime('%Y%m%d'), summary=[])
+            summary_by_day[summary.date]['summary'].append(summary.as_dict())
+
+        return sorted(summary_by_day.values(), key=itemgetter('date'), reverse=True)
+
+    def update_daily_summary(self, moves_profile, date):
+        """Rebuild the DailyActivitySummary rows of one day from its stored move segments, updating the totals."""
+        data_points = moves_profile.data_points.filter(date=date, type='move').without_track_points()
+        summaries = self.calculate_summary([p.segment for p in data_points])
+        old_summaries = moves_profile.daily_summaries.filter(date=date)
+        old = [summary.as_dict() for summary in old_summaries]
+        old_summaries.delete()
+        DailyActivitySummary.objects.bulk_create([
+            DailyActivitySummary(
+                data_profile=moves_profile,
+                date=date,
+                activity=summary['activity'],
+                group=summary['group'],
+                duration=summary['duration'],
+                distance=summary['distance'],
+                steps=summary.get('steps', 0),
+                calories=summary.get('calories', 0),
+                count=summary['count'],
+                max_speed=summary['max_speed']
+            ) for summary in summaries
+        ])
+        self.update_totals(moves_profile, date, old, summaries)
+
+    def rebuild_daily_summaries(self, moves_profile):
+        """Rebuild the DailyActivitySummary rows of every imported day."""
+        dates = moves_profile.data_points.order_by('date').values_list('date', flat=True).distinct()
+        for date in dates:
+            with transaction.atomic():
+                self.update_daily_summary(moves_profile, date)
+        if dates:
+            self.touch_imported_at(moves_profile)
+        return len(dates)
+
+    def get_storyline_date(self, user, date, track_points=True):
+        return self.get_data_points_date(user, date, track_points=track_points)
 
     def import_storyline(self, user):
         moves_profile = user.data_profiles.get(provider=self.name)
-        if 'profile' in moves_profile.data:
-            if moves_profile.data_points.exists():
-                next_date = moves_profile.data_points.latest('date').date - timedelta(days=1)
+        next_date = self.next_import_date(moves_profile)
+        if next_date is not None:
+            self.import_storyline_windows(moves_profile, self.import_windows(next_date, datetime.now().date()))
+
+    def next_import_date(self, moves_profile):
+        """The day before the newest stored date (it may have been incomplete), or the first day of the profile."""
+        if 'profile' not in moves_profile.data:
+            return None
+        latest_date = moves_profile.data_points.latest_date()
+        if latest_date is not None:
+            return latest_date - timedelta(days=1)
+        return self.create_date(moves_profile.data['profile']['firstDate']).date()
+
+    def start_import(self, user):
+        """Queue an import job for the user, unless one is already queued or running.
+
+        Active jobs without a heartbeat for `import_job_stale_after` seconds belong to
+        a crashed worker (or a lost message) and are queued again, they resume after
+        their last imported date. Returns the job and whether it has been queued.
+        """
+        with transaction.atomic():
+            # serializes concurrent requests of the same user
+            moves_profile = DataProfile.objects.select_for_update().get(user=user, provider=self.name)
+            job = moves_profile.import_jobs.filter(state__in=ImportJob.ACTIVE_STATES).order_by('-id').first()
+            stale = timezone.now() - timedelta(seconds=self.config.get('import_job_stale_after', 600))
+            if job is not None and job.updated_at > stale:
+                return job, False
+
+            if job is None:
+                job = moves_profile.import_jobs.create()
             else:
-                next_date = self.create_date(moves_profile.data['profile']['firstDate'])
-            current_date = datetime.now() + timedelta(days=1)
-            import_done = False
-            while not import_done:
-                self.import_storyline_date(user, next_date)
-                next_date = next_date + timedelta(days=1)
-                if next_date.strftime('%Y%m%d') == current_date.strftime('%Y%m%d'):
-                    import_done = True
+                job.state = ImportJob.QUEUED
+                job.save(update_fields=['state', 'updated_at'])
+            message = dict(provider=self.name, user_id=user.id, job_id=job.id)
+            transaction.on_commit(lambda: Channel('background-import-data').send(message))
+        return job, True
+
+    def cancel_import(self, user):
+        """Cancel the active import job of the user, a running import stops after the current window."""
+        moves_profile = user.data_profiles.get(provider=self.name)
+        job = moves_profile.import_jobs.filter(state__in=ImportJob.ACTIVE_STATES).order_by('-id').first()
+        cancelled = moves_profile.import_jobs.filter(state__in=ImportJob.ACTIVE_STATES).update(
+            state=ImportJob.CANCELLED, updated_at=timezone.now()
+        )
+        if job is not None:
+            job.state = ImportJob.CANCELLED
+            self.publish_import_progress(job, force=True)
+        return cancelled
+
+    def get_import_job(self, user):
+        """Latest import job of the user, None without any."""
+        return ImportJob.objects.filter(
+            data_profile__user=user, data_profile__provider=self.name
+        ).order_by('-id').first()
+
+    def run_import_job(self, job_id):
+        """Run a queued import job. Returns False if the job was already claimed by another worker."""
+        claimed = ImportJob.objects.filter(id=job_id, state=ImportJob.QUEUED).update(
+            state=ImportJob.RUNNING, updated_at=timezone.now()
+        )
+        if not claimed:
+            return False
+
+        job = ImportJob.objects.select_related('data_profile').get(id=job_id)
+        moves_profile = job.data_profile
+        if job.from_date is None:
+            job.from_date = self.next_import_date(moves_profile)
+            if job.from_date is None:
+                job.state = ImportJob.FAILED
+                job.error = 'The MOVES profile has not been synced yet'
+                job.save()
+                return True
+            job.to_date = datetime.now().date()
+            job.days_total = max(0, (job.to_date - job.from_date).days + 1)
+            job.save(update_fields=['from_date', 'to_date', 'days_total', 'updated_at'])
+        self.publish_import_progress(job, force=True)
+
+        # resume after the last committed window
+        from_date = job.cursor + timedelta(days=1) if job.cursor else job.from_date
+        if self.import_storyline_windows(moves_profile, self.import_windows(from_date, job.to_date), job):
+            ImportJob.objects.filter(id=job.id, state=ImportJob.RUNNING).update(
+                state=ImportJob.DONE, updated_at=timezone.now()
+            )
+        else:
+            ImportJob.objects.filter(id=job.id, state=ImportJob.RUNNING).update(
+                state=ImportJob.FAILED, error=job.error, updated_at=timezone.now()
+            )
+        job.refresh_from_db()
+        self.publish_import_progress(job, force=True)
+        return True
+
+    def advance_import_job(self, job, to_date):
+        """Record a committed window. Returns False if the job has been cancelled meanwhile."""
+        job.cursor = to_date
+        job.days_done = (to_date - job.from_date).days + 1
+        running = bool(ImportJob.objects.filter(id=job.id, state=ImportJob.RUNNING).update(
+            cursor=job.cursor, days_done=job.days_done, updated_at=timezone.now()
+        ))
+        if running:
+            self.publish_import_progress(job)
+        return running
+
+    def progress_group(self, user_id):
+        """Channels group of the websockets of a user, receiving the progress of the user's imports."""
+        return Group('imports-{}'.format(user_id))
+
+    def publish_import_progress(self, job, force=False):
+        """Send the state of an import job to the user's websockets.
+
+        Events are throttled to one per `import_progress_interval` seconds, each one
+        carries the complete progress so skipped events lose nothing. State changes
+        are sent with force=True.
+        """
+        now = time.monotonic()
+        published_at = getattr(job, 'published_at', None)
+        interval = self.config.get('import_progress_interval', 1)
+        if not force and published_at is not None and now - published_at < interval:
+            return False
+        job.published_at = now
+        try:
+            # imports run inside a consumer, whose sends are delayed until it returns otherwise
+            self.progress_group(job.data_profile.user_id).send(self.import_progress_message(job), immediately=True)
+        except Exception as e:
+            print('Progress ERROR {}'.format(e))
+            return False
+        return True
+
+    def import_progress_message(self, job):
+        """Websocket message with the complete progress of an import job."""
+        return {'text': json.dumps(dict(
+            type='import',
+            state=job.state,
+            days_done=job.days_done,
+            days_total=job.days_total,
+            progress=job.progress,
+            cursor=job.cursor.isoformat() if job.cursor else None,
+            error=job.error
+        ))}
+
+    def import_windows(self, from_date, to_date):
+        """Split the days from from_date to to_date (inclusive) into API sized windows."""
+        window_days = max(1, min(self.config.get('import_window_days', 7), self.max_storyline_window_days))
+        while from_date <= to_date:
+            window_end = min(from_date + timedelta(days=window_days - 1), to_date)
+            yield from_date, window_end
+            from_date = window_end + timedelta(days=1)
+
+    def import_storyline_windows(self, moves_profile, windows, job=None):
+        """Fetch the date windows concurrently and store them strictly in date order.
+
+        The worker threads only talk to the API (sharing the profile's rate limiter),
+        all database writes happen here. At most two windows per worker are in flight,
+        and the first failing window stops the import, so the latest stored date is
+        always a valid point to resume from. With an ImportJob every stored window
+        advances its cursor, a cancelled job stops the import.
+        """
+        workers = max(1, self.config.get('import_workers', 4))
+        windows = iter(windows)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                while True:
+                    for from_date, to_date in windows:
+                        pending.append((to_date, executor.submit(
+                            self.fetch_storyline_range, moves_profile, from_date, to_date
+                        )))
+                        if len(pending) >= workers * 2:
+                            break
+                    if not pending:
+                        break
+                    to_date, future = pending.popleft()
+                    self.store_storyline(moves_profile, self.wait_for_window(future, job))
+                    if job is not None and not self.advance_import_job(job, to_date):
+                        break
+            except Exception as e:
+                self.log_import_error(e)
+                if job is not None:
+                    job.error = str(e)
+                return False
+            finally:
+                for to_date, future in pending:
+                    future.cancel()
+        return True
+
+    def log_import_error(self, e):
+        """Log a failed import with its traceback, and the API's message if the error has one."""
+        logger.exception('Import ERROR %s', getattr(e, 'message', e))
+
+    def wait_for_window(self, future, job=None):
+        """Result of a window fetch, keeping the heartbeat of the job alive while waiting.
+
+        Fetches can sleep in the rate limiter (up to an hour with an exhausted hour
+        quota) or in retry backoff, the job must not look crashed meanwhile.
+        """
+        if job is None:
+            return future.result()
+        while True:
+            try:
+                return future.result(timeout=self.config.get('import_heartbeat_interval', 60))
+            except FutureTimeoutError:
+                ImportJob.objects.filter(id=job.id, state=ImportJob.RUNNING).update(updated_at=timezone.now())
+
+    def fetch_storyline_range(self, moves_profile, from_date, to_date):
+        """Storyline of all days from from_date to to_date (inclusive) with a single API request."""
+        return self.get_data(data_type='storyline', moves_profile=moves_profile, trackPoints='true', **{
+            'from': from_date.strftime('%Y%m%d'),
+            'to': to_date.strftime('%Y%m%d')
+        })
+
+    def import_storyline_range(self, user, from_date, to_date):
+        """Import all days from from_date to to_date (inclusive) with a single API request."""
+        moves_profile = user.data_profiles.get(provider=self.name)
+        try:
+            storyline_data = self.fetch_storyline_range(moves_profile, from_date, to_date)
+            self.store_storyline(moves_profile, storyline_data)
+        except Exception as e:
+            self.log_import_error(e)
 
     def import_storyline_date(self, user, date):
         moves_profile = user.data_profiles.get(provider=self.name)
         try:
-            storyline_data = self.get_data(data_type='storyline', moves_profile=moves_profile, date=date, trackPoints='true')
+            storyline_data = self.get_data(data_type='storyline', moves_profile=moves_profile, date=date,
+                                           trackPoints='true')
+            self.store_storyline(moves_profile, storyline_data)
+        except Exception as e:
+            self.log_import_error(e)
+
+    def store_storyline(self, moves_profile, storyline_data):
+        """Write a batch of storyline days (with their summaries and totals) in one transaction.
 
+        Only imported_at of the profile is saved, the token may have been
+        refreshed by another worker meanwhile.
+        """
+        with transaction.atomic():
+            changed = False
             for day in storyline_data:
-                if 'segments' in day and day['segments']:
-                    for segment in day['segments']:
-                        if not moves_profile.data_points.filter(
-                            date=self.create_date(day['date']),
-                            type=segment['type'],
-                            data__lastUpdate__contains=segment['lastUpdate']
-                        ):
-                            moves_profile.data_points.create(
-                                date=self.create_date(day['date']),
-                                type=segment['type'],
-                                data=segment
-                            )
-                            if segment['type'] == 'move':
-                                self.calculate_totals(moves_profile, segment['activities'])
+                changed = self.store_storyline_day(moves_profile, day) or changed
+            if changed:
+                self.touch_imported_at(moves_profile)
 
-            moves_profile.save()
-        except Exception as e:
-            if hasattr(e, 'message'):
-                print('Import ERROR {}'.format(e.message))
-            else:
-                print(e)
+    def store_storyline_day(self, moves_profile, day):
+        """Sync the stored segments of one storyline day with the API response.
+
+        Segments are identified by their segment_key, so importing a day twice is a
+        no-op: only unknown segments are inserted (in one bulk insert) and segments
+        replaced by a newer lastUpdate are removed. Returns True if the day changed.
+        """
+        if 'segments' not in day or not day['segments']:
+            return False
+
+        date = self.create_date(day['date']).date()
+        segments = OrderedDict()
+        for segment in day['segments']:
+            segments[self.segment_key(date, segment)] = segment
+
+        existing = set(moves_profile.data_points.filter(date=date).values_list('key', flat=True))
+        stale = existing - set(segments)
+        if stale:
+            moves_profile.data_points.filter(date=date, key__in=stale).delete()
+
+        data_points = []
+        tracks = {}
+        for key, segment in segments.items():
+            if key in existing:
+                continue
+            metrics_version = 0
+            if segment['type'] == 'move':
+                segment = self.calculate_distances(segment)
+                metrics_version = self.tracks.version
+                if self.weather.config.get('prefetch'):
+                    # a cache miss schedules the background fetch
+                    for activity in segment.get('activities', []):
+                        self.weather.get_activity_weather(activity)
+                # the trackPoints are stored packed in Tracks, not in the segment document
+                segment, tracks[key] = self.split_track_points(segment)
+            data_points.append(DataPoint(
+                data_profile=moves_profile,
+                date=date,
+                type=segment['type'],
+                key=key,
+                data=segment,
+                metrics_version=metrics_version
+            ))
+        DataPoint.objects.bulk_create(data_points)
+        self.store_tracks(data_points, tracks)
+
+        changed = bool(stale or data_points)
+        if changed:
+            self.update_daily_summary(moves_profile, date)
+            self.warm_day_geojson(moves_profile, date)
+        return changed
+
+    def warm_day_geojson(self, moves_profile, date):
+        """Build the GeoJSON cache entry of a changed day while it is at hand.
+
+        The new segment keys select a new entry, so the map would otherwise build
+        it on the first request. Filling the cache is optional: a failure is
+        logged and rolled back to a savepoint, it never fails the import.
+        """
+        try:
+            with transaction.atomic():
+                self.get_day_geojson(moves_profile, date)
+        except Exception:
+            logger.exception('GeoJSON of %s could not be cached', date)
+
+    def store_tracks(self, data_points, tracks):
+        """Pack the trackPoints split off newly created DataPoints, `tracks` maps segment keys to them."""
+        rows = []
+        for data_point in data_points:
+            for position, activity, track_points in tracks.get(data_point.key, []):
+                packed = self.tracks.pack(track_points)
+                lats = [point['lat'] for point in track_points]
+                lons = [point['lon'] for point in track_points]
+                rows.append(Track(
+                    data_profile_id=data_point.data_profile_id, data_point=data_point, date=data_point.date,
+                    activity=activity, position=position,
+                    min_lat=min(lats), min_lon=min(lons), max_lat=max(lats), max_lon=max(lons), **packed
+                ))
+        Track.objects.bulk_create(rows)
+
+    def segment_key(self, date, segment):
+        """Deterministic key of a segment version: date, type, startTime and lastUpdate."""
+        key = '{}|{}|{}|{}'.format(
+            date.strftime('%Y%m%d'), segment['type'], segment.get('startTime', ''), segment.get('lastUpdate', '')
+        )
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
 
     def get_profile(self, moves_profile):
         url = '{}/user/profile'.format(self.config['api'])
-        r = requests.get(url, headers=self.get_headers(moves_profile))
+        self.get_rate_limiter(moves_profile).acquire()
+        r = self.http.get(url, headers=self.get_headers(moves_profile))
         return r.json()
 
     def sync_profile_data(self, moves_profile):
         profile = self.get_profile(moves_profile)
-        moves_profile.data = profile
+        moves_profile.data.update(profile)
 
     def create_auth(self, code, user):
         """Create first access Token using Smartphone code from callback url."""
         access_token_url = '{}/access_token?grant_type=authorization_code&code={}&client_id={}&client_secret={}'.format(self.config['api_auth'], code, self.config['client_id'], self.config['client_secret'])
-        response = requests.post(access_token_url).json()
+        response = self.http.post(access_token_url).json()
         if 'error' not in response:
             moves_profile = user.data_profiles.get(provider=self.name)
-            moves_profile.auth_data = response
+            moves_profile.auth_data = self.with_expiry(response)
             self.sync_profile_data(moves_profile)
             moves_profile.save()
         else:
@@ -331,37 +939,106 @@ class MovesService:
     def validate_access_token(self, user):
         """Validate the access token."""
         moves_profile = user.data_profiles.get(provider=self.name)
+        return 'error' not in self.get_token_info(moves_profile)
+
+    def get_token_info(self, moves_profile):
         validate_url = '{}/tokeninfo?access_token={}'.format(
             self.config['api_auth'], moves_profile.auth_data['access_token']
         )
-        response = requests.get(validate_url).json()
-        return True if 'error' not in response else False
+        return self.http.get(validate_url).json()
 
     def refresh_access_token(self, user):
         """Refresh the access token."""
         moves_profile = user.data_profiles.get(provider=self.name)
+        self.refresh_profile_token(moves_profile)
+
+    def refresh_profile_token(self, moves_profile):
+        """Refresh the access token of a loaded data profile."""
         access_token_url = '{}/access_token?grant_type=refresh_token&refresh_token={}&client_id={}&client_secret={}'.format(self.config['api_auth'], moves_profile.auth_data['refresh_token'], self.config['client_id'], self.config['client_secret'])
-        response = requests.post(access_token_url).json()
+        response = self.http.post(access_token_url).json()
         if 'error' not in response:
-            moves_profile.auth_data = response
-            self.sync_profile_data(user)
-            moves_profile.save()
+            moves_profile.auth_data = self.with_expiry(response)
+            self.sync_profile_data(moves_profile)
+            moves_profile.save(update_fields=['auth_data', 'data'])
         else:
-            raise Exception(response['error'])
+            raise MovesAuthError(response['error'])
+
+    def refresh_expired_token(self, moves_profile, access_token):
+        """Refresh the token after a 401, once, even if several import threads hit the 401."""
+        with self.token_lock:
+            if moves_profile.auth_data['access_token'] == access_token:
+                self.refresh_profile_token(moves_profile)
 
     def validate_authentication(self, user):
-        """Check if user has a valid access token and if not refresh it."""
-        if not self.validate_access_token(user):
-            self.refresh_access_token(user)
+        """Check if user has a valid access token and if not refresh it.
+
+        Known validity is cached until shortly before the token expires, so a page
+        view usually costs one cache lookup instead of a /tokeninfo round trip.
+        Tokens close to their expiry are refreshed by a background worker.
+        """
+        moves_profile = user.data_profiles.get(provider=self.name)
+        cache_key = self.token_cache_key(moves_profile)
+        if cache.get(cache_key):
+            return
+
+        expires_in = self.token_expires_in(moves_profile)
+        if expires_in is None:
+            # token stored before expiry tracking, ask the API once
+            token_info = self.get_token_info(moves_profile)
+            if 'error' in token_info:
+                expires_in = 0
+            else:
+                moves_profile.auth_data['expires_at'] = time.time() + token_info.get('expires_in', 0)
+                moves_profile.save(update_fields=['auth_data'])
+                expires_in = self.token_expires_in(moves_profile)
+
+        if expires_in <= 0:
+            self.refresh_profile_token(moves_profile)
+            cache_key = self.token_cache_key(moves_profile)
+            expires_in = self.token_expires_in(moves_profile) or 0
+        elif expires_in < self.config.get('token_refresh_ahead', 7 * 24 * 60 * 60):
+            self.schedule_token_refresh(moves_profile)
+
+        timeout = min(expires_in, self.config.get('token_cache_timeout', 60 * 60))
+        if timeout > 0:
+            cache.set(cache_key, True, timeout=int(timeout))
+
+    def schedule_token_refresh(self, moves_profile):
+        """Ask the background worker to refresh the token, at most once per 10 minutes."""
+        if cache.add('moves:token-refresh:{}'.format(moves_profile.id), True, timeout=10 * 60):
+            Channel('background-refresh-token').send(dict(
+                provider=self.name,
+                user_id=moves_profile.user_id
+            ))
+
+    def token_expires_in(self, moves_profile):
+        """Seconds until the access token expires, None if the expiry is unknown."""
+        if 'expires_at' not in moves_profile.auth_data:
+            return None
+        return moves_profile.auth_data['expires_at'] - time.time()
+
+    def token_cache_key(self, moves_profile):
+        token = moves_profile.auth_data.get('access_token', '')
+        return 'moves:token-valid:{}:{}'.format(moves_profile.id, hashlib.sha1(token.encode('utf-8')).hexdigest())
+
+    def with_expiry(self, auth_data):
+        """Store the absolute expiry of a token response next to its expires_in."""
+        if 'expires_in' in auth_data:
+            auth_data['expires_at'] = time.time() + auth_data['expires_in']
+        return auth_data
 
     def get_config(self):
         return settings.MOVES_API
 
+    def get_rate_limiter(self, moves_profile):
+        """Limiter shared by all requests of a profile, following the API's per user limits."""
+        return ratelimit.get_rate_limiter(moves_profile.id, [
+            (self.config.get('rate_limit_minute', 60), 60),
+            (self.config.get('rate_limit_hour', 2000), 60 * 60),
+        ])
+
     def get_headers(self, moves_profile):
         return {'Authorization':  'Bearer {}'.format(moves_profile.auth_data['access_token'])}
 
     def create_date(self, date_string):
-        try:
-            return datetime.strptime(date_string, '%Y%m%dT%H%M%S%z')
-        except ValueError:
-            return datetime.strptime(date_string, '%Y%m%d')
+        return timestamps.parse(date_string)
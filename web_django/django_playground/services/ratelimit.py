@@ -0,0 +1,54 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Thread-safe token bucket limiter enforcing several limits at once.
+
+    `limits` is a list of (requests, seconds) tuples, e.g. [(60, 60), (2000, 3600)]
+    for 60 requests per minute and 2000 per hour. Every bucket starts full and
+    refills continuously; a request needs a token from every bucket.
+    """
+
+    def __init__(self, limits, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        now = self.clock()
+        self.buckets = [dict(capacity=float(requests), rate=requests / seconds, tokens=float(requests), updated=now)
+                        for requests, seconds in limits]
+
+    def refill(self, now):
+        for bucket in self.buckets:
+            elapsed = max(0, now - bucket['updated'])
+            bucket['tokens'] = min(bucket['capacity'], bucket['tokens'] + elapsed * bucket['rate'])
+            bucket['updated'] = now
+
+    def try_acquire(self):
+        """Take a token from every bucket, returns the seconds to wait if that is not possible (0 on success)."""
+        with self.lock:
+            self.refill(self.clock())
+            missing = [(1 - bucket['tokens']) / bucket['rate'] for bucket in self.buckets if bucket['tokens'] < 1]
+            if missing:
+                return max(missing)
+            for bucket in self.buckets:
+                bucket['tokens'] -= 1
+            return 0
+
+    def acquire(self):
+        """Block until a request is allowed by all limits."""
+        wait = self.try_acquire()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(key, limits):
+    """Shared RateLimiter per key (e.g. per data profile), created on first use."""
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(limits)
+        return _limiters[key]
@@ -0,0 +1,171 @@
+import math
+import struct
+
+import numpy as np
+
+from .tracks import TrackService
+
+
+def varint(value):
+    """Protocol buffers base 128 varint."""
+    encoded = bytearray()
+    while True:
+        bits = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(bits | 0x80)
+        else:
+            encoded.append(bits)
+            return bytes(encoded)
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def tag(number, wire_type):
+    return varint((number << 3) | wire_type)
+
+
+def length_delimited(number, payload):
+    return tag(number, 2) + varint(len(payload)) + payload
+
+
+def packed(number, values):
+    return length_delimited(number, b''.join(varint(value) for value in values))
+
+
+def encode_value(value):
+    """A vector_tile.Tile.Value, strings, integers or doubles."""
+    if isinstance(value, str):
+        return length_delimited(1, value.encode('utf-8'))
+    if isinstance(value, int):
+        return tag(6, 0) + varint((value << 1) ^ (value >> 63))
+    return tag(3, 1) + struct.pack('<d', value)
+
+
+class TileService:
+    """Mapbox Vector Tiles (spec 2.1) of the stored tracks, encoded without protobuf dependencies.
+
+    Tracks are selected by their bounding box (users.Track), simplified to the
+    zoom level, projected to tile coordinates and cropped to the buffered tile.
+    """
+
+    extent = 4096
+
+    # pixels (in tile coordinates) around the tile, so lines don't end at tile borders
+    buffer = 64
+
+    layer = 'tracks'
+
+    max_zoom = 22
+
+    tracks = TrackService()
+
+    def is_valid(self, z, x, y):
+        return 0 <= z <= self.max_zoom and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+    def tile_bounds(self, z, x, y):
+        """(west, south, east, north) in degrees of a web mercator tile, including the buffer."""
+        n = 2 ** z
+        margin = self.buffer / self.extent
+
+        def lon(tile_x):
+            return tile_x / n * 360 - 180
+
+        def lat(tile_y):
+            return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+        return lon(x - margin), lat(y + 1 + margin), lon(x + 1 + margin), lat(y - margin)
+
+    def project(self, z, x, y, lat, lon):
+        """Integer tile coordinates of lat/lon arrays."""
+        n = 2 ** z
+        lat_radians = np.radians(np.clip(lat, -85.0511, 85.0511))
+        tile_x = ((lon + 180) / 360 * n - x) * self.extent
+        tile_y = ((1 - np.log(np.tan(lat_radians) + 1 / np.cos(lat_radians)) / np.pi) / 2 * n - y) * self.extent
+        return np.round(tile_x).astype(np.int64), np.round(tile_y).astype(np.int64)
+
+    def line_parts(self, tile_x, tile_y):
+        """Split a projected line into the parts inside the buffered tile.
+
+        The neighbours of inside points are kept, so lines leave the tile at the
+        right angle. Repeated points are dropped, parts need at least two points.
+        """
+        low, high = -self.buffer, self.extent + self.buffer
+        inside = (tile_x >= low) & (tile_x <= high) & (tile_y >= low) & (tile_y <= high)
+        keep = inside.copy()
+        keep[1:] |= inside[:-1]
+        keep[:-1] |= inside[1:]
+
+        moved = np.ones(len(tile_x), dtype=bool)
+        moved[1:] = (np.diff(tile_x) != 0) | (np.diff(tile_y) != 0)
+
+        parts = []
+        for run in np.split(np.arange(len(tile_x)), np.flatnonzero(~keep)):
+            run = run[keep[run]]
+            run = run[moved[run] | (run == run[0])] if len(run) else run
+            if len(run) > 1:
+                parts.append((tile_x[run].tolist(), tile_y[run].tolist()))
+        return parts
+
+    def encode_geometry(self, parts):
+        """LineString/MultiLineString commands: MoveTo, LineTo with zigzag encoded deltas."""
+        geometry = []
+        cursor_x = cursor_y = 0
+        for xs, ys in parts:
+            for i, (px, py) in enumerate(zip(xs, ys)):
+                if i == 0:
+                    geometry.append(1 | (1 << 3))
+                elif i == 1:
+                    geometry.append(2 | ((len(xs) - 1) << 3))
+                geometry.append(zigzag(px - cursor_x))
+                geometry.append(zigzag(py - cursor_y))
+                cursor_x, cursor_y = px, py
+        return geometry
+
+    def encode(self, features):
+        """Tile with one layer, `features` is a list of (properties, line parts)."""
+        keys = []
+        values = []
+        encoded_features = []
+        for properties, parts in features:
+            tags = []
+            for key, value in sorted(properties.items()):
+                if key not in keys:
+                    keys.append(key)
+                if value not in values:
+                    values.append(value)
+                tags.extend([keys.index(key), values.index(value)])
+            encoded_features.append(length_delimited(2, b''.join([
+                packed(2, tags),
+                tag(3, 0) + varint(2),  # LINESTRING
+                packed(4, self.encode_geometry(parts)),
+            ])))
+
+        layer = b''.join(
+            [tag(15, 0) + varint(2), length_delimited(1, self.layer.encode('utf-8'))] +
+            encoded_features +
+            [length_delimited(3, key.encode('utf-8')) for key in keys] +
+            [length_delimited(4, encode_value(value)) for value in values] +
+            [tag(5, 0) + varint(self.extent)]
+        )
+        return length_delimited(3, layer) if encoded_features else b''
+
+    def render(self, moves_profile, z, x, y, from_date=None, to_date=None):
+        """Vector tile bytes of the tracks of a profile, optionally limited to a date range."""
+        tracks = moves_profile.tracks.in_bounds(*self.tile_bounds(z, x, y))
+        if from_date is not None:
+            tracks = tracks.filter(date__gte=from_date)
+        if to_date is not None:
+            tracks = tracks.filter(date__lte=to_date)
+
+        features = []
+        for track in tracks.only('date', 'activity', 'lats', 'lons').order_by('date', 'id').iterator():
+            lat = np.frombuffer(track.lats, dtype=np.float64)
+            lon = np.frombuffer(track.lons, dtype=np.float64)
+            keep = self.tracks.simplify(lat, lon, zoom=z)
+            parts = self.line_parts(*self.project(z, x, y, lat[keep], lon[keep]))
+            if parts:
+                features.append((dict(activity=track.activity, date=track.date.isoformat()), parts))
+        return self.encode(features)
@@ -0,0 +1,114 @@
+"""Parsing of the fixed MOVES timestamp formats without strptime.
+
+MOVES sends dates as YYYYMMDD and times as YYYYMMDDTHHMMSS followed by a UTC
+offset (+HHMM) or Z. The fields are at fixed positions, so they are sliced
+instead of matched against a format, the few distinct offsets are cached and
+arrays of timestamps are converted with numpy in one go.
+"""
+from datetime import date, datetime, timedelta, timezone
+import time
+
+import numpy as np
+
+# proleptic gregorian ordinal of 1970-01-01
+EPOCH_ORDINAL = 719163
+
+_offsets = {}
+_zones = {}
+_suffixes = {}
+
+
+def offset_seconds(suffix):
+    """Seconds east of UTC of an offset suffix like +0100, -0530 or Z."""
+    seconds = _offsets.get(suffix)
+    if seconds is None:
+        if suffix == 'Z':
+            seconds = 0
+        elif len(suffix) != 5 or suffix[0] not in '+-':
+            raise ValueError('Invalid UTC offset: {!r}'.format(suffix))
+        else:
+            seconds = int(suffix[1:3]) * 3600 + int(suffix[3:5]) * 60
+            seconds = -seconds if suffix[0] == '-' else seconds
+        _offsets[suffix] = seconds
+    return seconds
+
+
+def zone(suffix):
+    """tzinfo of an offset suffix, one instance per distinct offset."""
+    tzinfo = _zones.get(suffix)
+    if tzinfo is None:
+        tzinfo = _zones[suffix] = timezone(timedelta(seconds=offset_seconds(suffix)))
+    return tzinfo
+
+
+def parse(value):
+    """datetime of a MOVES date (naive) or time (aware), like strptime with '%Y%m%d' / '%Y%m%dT%H%M%S%z'."""
+    if len(value) == 8:
+        return datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    if len(value) < 16 or value[8] != 'T':
+        raise ValueError('Invalid MOVES timestamp: {!r}'.format(value))
+    return datetime(
+        int(value[0:4]), int(value[4:6]), int(value[6:8]),
+        int(value[9:11]), int(value[11:13]), int(value[13:15]),
+        tzinfo=zone(value[15:])
+    )
+
+
+def days_from_civil(year, month, day):
+    """Days since 1970-01-01 of arrays of proleptic gregorian dates."""
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def epoch_seconds(value):
+    """Unix time of a MOVES time string."""
+    if len(value) < 16 or value[8] != 'T':
+        raise ValueError('Invalid MOVES timestamp: {!r}'.format(value))
+    days = date(int(value[0:4]), int(value[4:6]), int(value[6:8])).toordinal() - EPOCH_ORDINAL
+    return float(days * 86400 + int(value[9:11]) * 3600 + int(value[11:13]) * 60 + int(value[13:15]) -
+                 offset_seconds(value[15:]))
+
+
+def epoch_array(values):
+    """Unix times (float64) and UTC offsets in seconds (int32) of a sequence of MOVES time strings."""
+    if not len(values):
+        return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int32)
+    chars = np.array(values, dtype='S20').view(np.uint8).reshape(-1, 20).astype(np.int64)
+    digits = chars - ord('0')
+
+    def number(start, end):
+        result = digits[:, start]
+        for column in range(start + 1, end):
+            result = result * 10 + digits[:, column]
+        return result
+
+    if not ((chars[:, 8] == ord('T')).all() and np.isin(chars[:, 15], [ord('+'), ord('-'), ord('Z')]).all()):
+        raise ValueError('Invalid MOVES timestamps')
+    utc = chars[:, 15] == ord('Z')
+    sign = np.where(chars[:, 15] == ord('-'), -1, 1)
+    offsets = np.where(utc, 0, sign * (number(16, 18) * 3600 + number(18, 20) * 60))
+
+    days = days_from_civil(number(0, 4), number(4, 6), number(6, 8))
+    seconds = days * 86400 + number(9, 11) * 3600 + number(11, 13) * 60 + number(13, 15) - offsets
+    return seconds.astype(np.float64), offsets.astype(np.int32)
+
+
+def suffix(offset):
+    """Offset suffix (+HHMM) of seconds east of UTC."""
+    text = _suffixes.get(offset)
+    if text is None:
+        minutes = abs(offset) // 60
+        text = _suffixes[offset] = '{}{:02d}{:02d}'.format('-' if offset < 0 else '+', minutes // 60, minutes % 60)
+    return text
+
+
+def format_time(seconds, offset):
+    """MOVES time string of a unix time in a UTC offset, the inverse of epoch_seconds."""
+    local = time.gmtime(seconds + offset)
+    return '{:04d}{:02d}{:02d}T{:02d}{:02d}{:02d}{}'.format(
+        local.tm_year, local.tm_mon, local.tm_mday, local.tm_hour, local.tm_min, local.tm_sec, suffix(offset)
+    )
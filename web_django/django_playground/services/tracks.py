@@ -0,0 +1,168 @@
+import numpy as np
+
+from . import timestamps
+
+
+class TrackService:
+    """Vectorized calculations on the trackPoints of MOVES activities."""
+
+    # mean earth radius in meters
+    R = 6371e3
+
+    # meters per pixel at zoom level 0 on the equator (256px web mercator tiles)
+    zoom0_resolution = 156543.03392
+
+    # bump whenever the derived metrics change, stored DataPoints get recomputed
+    version = 1
+
+    def track_arrays(self, track_points):
+        """Turn a list of trackPoints into numpy arrays (lat, lon, epoch seconds)."""
+        count = len(track_points)
+        lat = np.fromiter((p['lat'] for p in track_points), dtype=np.float64, count=count)
+        lon = np.fromiter((p['lon'] for p in track_points), dtype=np.float64, count=count)
+        seconds, _ = timestamps.epoch_array([p['time'] for p in track_points])
+        return lat, lon, seconds
+
+    def utc_offset(self, time_string):
+        """UTC offset in seconds of a MOVES time string (e.g. 20180120T101500+0100)."""
+        return timestamps.offset_seconds(time_string[15:])
+
+    def pack(self, track_points):
+        """Columnar binary arrays of trackPoints: lat, lon, epoch seconds and UTC offsets."""
+        count = len(track_points)
+        lat = np.fromiter((p['lat'] for p in track_points), dtype=np.float64, count=count)
+        lon = np.fromiter((p['lon'] for p in track_points), dtype=np.float64, count=count)
+        seconds, utc_offsets = timestamps.epoch_array([p['time'] for p in track_points])
+        return dict(
+            lats=lat.tobytes(), lons=lon.tobytes(), seconds=seconds.tobytes(), utc_offsets=utc_offsets.tobytes()
+        )
+
+    def unpack(self, track):
+        """The arrays of a packed users.Track: lat, lon, epoch seconds and UTC offsets."""
+        return (
+            np.frombuffer(track.lats, dtype=np.float64),
+            np.frombuffer(track.lons, dtype=np.float64),
+            np.frombuffer(track.seconds, dtype=np.float64),
+            np.frombuffer(track.utc_offsets, dtype=np.int32),
+        )
+
+    def track_points(self, lat, lon, seconds, utc_offsets):
+        """trackPoints of packed arrays, with distance and speeds like calculate_activity adds them."""
+        track_points = []
+        for point_lat, point_lon, point_seconds, offset in zip(lat.tolist(), lon.tolist(), seconds.tolist(),
+                                                               utc_offsets.tolist()):
+            track_points.append(dict(lat=point_lat, lon=point_lon, time=timestamps.format_time(point_seconds, offset)))
+
+        if len(track_points) > 1:
+            distance, speed, speed_kmh, valid = self.segment_metrics(lat, lon, seconds)
+            for i in np.flatnonzero(valid).tolist():
+                track_point = track_points[i + 1]
+                track_point['speed'] = float(speed[i])
+                track_point['speed_kmh'] = float(speed_kmh[i])
+                track_point['distance'] = float(distance[i])
+        return track_points
+
+    def epoch_seconds(self, time_string):
+        return timestamps.epoch_seconds(time_string)
+
+    def haversine(self, lat, lon):
+        """Distances in meters between consecutive points.
+
+        Haversine formula: a = sin²(Δφ/2) + cos φ1 ⋅ cos φ2 ⋅ sin²(Δλ/2)
+        c = 2 ⋅ atan2( √a, √(1−a) )
+        d = R ⋅ c
+        """
+        lat_radians = np.radians(lat)
+        lat_distance = np.radians(np.diff(lat))
+        lon_distance = np.radians(np.diff(lon))
+        sin_lat = np.sin(lat_distance / 2)
+        sin_lon = np.sin(lon_distance / 2)
+        a = sin_lat * sin_lat + np.cos(lat_radians[:-1]) * np.cos(lat_radians[1:]) * sin_lon * sin_lon
+        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        return self.R * c
+
+    def segment_metrics(self, lat, lon, seconds):
+        """Per-segment distance (m), speed (m/s) and speed (km/h) for consecutive points.
+
+        Segments without elapsed time get NaN speeds, like the pure python version
+        which skipped them.
+        """
+        distance = self.haversine(lat, lon)
+        elapsed = np.diff(seconds)
+        valid = elapsed > 0
+        speed = np.full(distance.shape, np.nan)
+        np.divide(distance, elapsed, out=speed, where=valid)
+        speed_kmh = speed * 60 * 60 / 1000
+        return distance, speed, speed_kmh, valid
+
+    def calculate_activity(self, activity):
+        """Annotate the trackPoints of an activity with distance/speed and set max/avg speed."""
+        max_speed = 0
+        avg_speed = 0
+        track_points = activity.get('trackPoints')
+        if track_points and len(track_points) > 1:
+            lat, lon, seconds = self.track_arrays(track_points)
+            distance, speed, speed_kmh, valid = self.segment_metrics(lat, lon, seconds)
+
+            for i in np.flatnonzero(valid).tolist():
+                track_point = track_points[i + 1]
+                track_point['speed'] = float(speed[i])
+                track_point['speed_kmh'] = float(speed_kmh[i])
+                track_point['distance'] = float(distance[i])
+
+            if valid.any():
+                valid_kmh = speed_kmh[valid]
+                max_speed = max(float(valid_kmh.max()), 0)
+                avg_speed = float(valid_kmh.mean())
+
+        activity['max_speed'] = max_speed
+        activity['avg_speed'] = avg_speed
+        return activity
+
+    def zoom_tolerance(self, zoom, lat):
+        """Size of one map pixel in meters at a zoom level and latitude."""
+        return self.zoom0_resolution * np.cos(np.radians(lat)) / 2 ** zoom
+
+    def simplify(self, lat, lon, tolerance=None, zoom=None):
+        """Indices of the points kept by Douglas-Peucker simplification.
+
+        `tolerance` is the maximum deviation in meters, alternatively `zoom` uses
+        the size of a map pixel at that zoom level. The points are projected to
+        a local equirectangular plane, the distances of each range to its chord
+        are calculated at once with numpy.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        count = len(lat)
+        if tolerance is None and zoom is not None and count:
+            tolerance = self.zoom_tolerance(zoom, lat.mean())
+        if count < 3 or not tolerance:
+            return np.arange(count)
+
+        x = np.radians(lon) * np.cos(np.radians(lat.mean())) * self.R
+        y = np.radians(lat) * self.R
+        keep = np.zeros(count, dtype=bool)
+        keep[0] = keep[-1] = True
+
+        ranges = [(0, count - 1)]
+        while ranges:
+            first, last = ranges.pop()
+            if last - first < 2:
+                continue
+            dx = x[last] - x[first]
+            dy = y[last] - y[first]
+            px = x[first + 1:last] - x[first]
+            py = y[first + 1:last] - y[first]
+            length = np.hypot(dx, dy)
+            if length > 0:
+                deviation = np.abs(dx * py - dy * px) / length
+            else:
+                deviation = np.hypot(px, py)
+            i = int(np.argmax(deviation))
+            if deviation[i] > tolerance:
+                index = first + 1 + i
+                keep[index] = True
+                ranges.append((first, index))
+                ranges.append((index, last))
+
+        return np.flatnonzero(keep)
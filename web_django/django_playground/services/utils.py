@@ -1,8 +1,14 @@
 
 from datetime import date, datetime, timedelta
 from dateutil.relativedelta import relativedelta
+import json
+
+from .tracks import TrackService
+
 
 class UtilsService:
+    tracks = TrackService()
+
     def hello(self):
         print("testclass")
 
@@ -138,18 +144,24 @@ class UtilsService:
         return feature
 
 
-    def geojson_move(self, segment):
+    def geojson_move(self, segment, tolerance=None, zoom=None):
         features = []
-        for activity in segment['activities']:
-            geojson = self.geojson_activity(activity)
+        for activity in segment.get('activities', []):
+            geojson = self.geojson_activity(activity, tolerance, zoom)
             features.append(geojson)
 
         return features
 
-    def geojson_activity(self, activity):
+    def geojson_activity(self, activity, tolerance=None, zoom=None):
+        """LineString feature of an activity, simplified if a tolerance (m) or map zoom is given."""
         lookup = {'walking': 'Walking', 'transport': 'Transport', 'run': 'Running', 'cycling': 'Cycling'}
         stroke = {'walking': '#00d45a', 'transport': '#000000', 'run': '#93139a', 'cycling': '#00ceef'}
-        trackpoints = activity['trackPoints']
+        # activities without a track (e.g. short walks) have no trackPoints
+        trackpoints = activity.get('trackPoints', [])
+        if tolerance or zoom is not None:
+            keep = self.tracks.simplify([point['lat'] for point in trackpoints],
+                                        [point['lon'] for point in trackpoints], tolerance, zoom)
+            trackpoints = [trackpoints[i] for i in keep.tolist()]
         coordinates = [[point['lon'], point['lat']] for point in trackpoints]
         timestamps = [point['time'] for point in trackpoints]
         geojson = {'type': 'Feature', 'geometry': {}, 'properties': {}}
@@ -170,6 +182,23 @@ class UtilsService:
 
         return geojson
 
+    def geojson_features(self, segments, tolerance=None, zoom=None):
+        """Generate the features of the place and move segments one by one."""
+        for segment in segments:
+            if segment['type'] == 'place':
+                yield self.geojson_place(segment)
+            elif segment['type'] == 'move':
+                yield from self.geojson_move(segment, tolerance, zoom)
+
+    def geojson_stream(self, features):
+        """Serialize a FeatureCollection in chunks, one feature at a time."""
+        yield '{"type": "FeatureCollection", "features": ['
+        separator = ''
+        for feature in features:
+            yield separator + json.dumps(feature)
+            separator = ', '
+        yield ']}'
+
     def get_activity_color(self, activity):
         if activity == 'transport': #444 ?
             return '#444444'
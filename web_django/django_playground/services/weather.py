@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.cache import cache
+from channels import Channel
+
+from .http_client import HttpClient
+from .tracks import TrackService
+
+
+class WeatherService:
+    """Historic weather conditions from the DarkSky API, cached by rounded location and hour.
+
+    Locations are rounded to 2 decimals (about 1 km) and times to the hour, so
+    nearby activities share one request. Past weather does not change, entries
+    never expire. Pages only read the cache, misses are fetched by the
+    background-fetch-weather worker. Failed requests are not cached, the
+    pending marker of the scheduled fetch delays the retry.
+    """
+
+    config = settings.DARKSKY_API
+
+    http = HttpClient()
+
+    tracks = TrackService()
+
+    cache_timeout = None
+
+    # a scheduled fetch is not scheduled again for this long
+    pending_timeout = 60 * 5
+
+    def cache_key(self, lat, lon, seconds):
+        return 'weather:{:.2f}:{:.2f}:{}'.format(lat, lon, int(seconds // 3600))
+
+    def get_weather(self, lat, lon, seconds):
+        """Cached conditions at a location and time, schedules a background fetch on a miss."""
+        weather = cache.get(self.cache_key(lat, lon, seconds))
+        if weather is None:
+            self.schedule_fetch(lat, lon, seconds)
+        return weather
+
+    def get_activity_weather(self, activity):
+        """Cached conditions at the first trackPoint of an activity, None if not known (yet)."""
+        if not activity.get('trackPoints'):
+            return None
+        track_point = activity['trackPoints'][0]
+        return self.get_weather(track_point['lat'], track_point['lon'], self.tracks.epoch_seconds(track_point['time']))
+
+    def schedule_fetch(self, lat, lon, seconds):
+        key = self.cache_key(lat, lon, seconds)
+        if cache.get(key) is None and cache.add('{}:pending'.format(key), True, self.pending_timeout):
+            # imports run inside a consumer, whose sends are delayed until it returns otherwise
+            Channel('background-fetch-weather').send(dict(lat=lat, lon=lon, seconds=seconds), immediately=True)
+
+    def fetch(self, lat, lon, seconds):
+        """Request the conditions of the rounded location and hour and cache them.
+
+        Returns None without caching anything if the request failed.
+        """
+        key = self.cache_key(lat, lon, seconds)
+        weather = cache.get(key)
+        if weather is None:
+            url = '{}/{:.2f},{:.2f},{}?units=auto'.format(self.config['api'], lat, lon, int(seconds // 3600) * 3600)
+            r = self.http.get(url)
+            try:
+                weather = r.json() if r.status_code == 200 else None
+            except ValueError:
+                weather = None
+            if not isinstance(weather, dict) or 'error' in weather:
+                print('Weather ERROR {} {}'.format(r.status_code, weather))
+                return None
+            cache.set(key, weather, self.cache_timeout)
+        return weather
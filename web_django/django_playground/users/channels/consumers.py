@@ -5,11 +5,17 @@ from channels.auth import channel_session_user, channel_session_user_from_http
 import json
 
 from ..models import User
-from ...services import moves_service
+from ...services import moves_service, weather_service
 
 @channel_session_user_from_http
 def ws_connect(message):
     Group('users').add(message.reply_channel)
+    if message.user.is_authenticated:
+        moves_service.progress_group(message.user.id).add(message.reply_channel)
+        # the import may have progressed or even finished before the socket connected
+        job = moves_service.get_import_job(message.user)
+        if job is not None:
+            message.reply_channel.send(moves_service.import_progress_message(job))
     Group('users').send({
         'text': json.dumps({
             'username': message.user.username,
@@ -27,6 +33,8 @@ def ws_disconnect(message):
         })
     })
     Group('users').discard(message.reply_channel)
+    if message.user.is_authenticated:
+        moves_service.progress_group(message.user.id).discard(message.reply_channel)
 
 def hello(message):
     print("Called Background task!")  # long running task or printing
@@ -34,5 +42,13 @@ def hello(message):
 
 def import_data(action):
     print("Background Import!")  # long running task or printing
+    moves_service.run_import_job(action['job_id'])
+
+
+def refresh_token(action):
     user = User.objects.get(id=action['user_id'])
-    moves_service.import_storyline(user)
+    moves_service.refresh_access_token(user)
+
+
+def fetch_weather(action):
+    weather_service.fetch(action['lat'], action['lon'], action['seconds'])
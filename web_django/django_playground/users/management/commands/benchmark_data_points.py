@@ -0,0 +1,105 @@
+from datetime import date, datetime, timedelta
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...models import DataPoint, DataProfile, Track, User
+from ....services import moves_service
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time the DataPoint read paths of a profile (or of a synthetic multi-year profile).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Benchmark the moves data of this user')
+        parser.add_argument('--synthetic-years', type=int, default=0,
+                            help='Generate this many years of synthetic data, rolled back afterwards')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measured query')
+
+    def handle(self, *args, **options):
+        if not options['username'] and not options['synthetic_years']:
+            raise CommandError('Either --username or --synthetic-years is required')
+
+        try:
+            with transaction.atomic():
+                if options['synthetic_years']:
+                    user = self.create_synthetic_user(options['synthetic_years'])
+                else:
+                    user = User.objects.get(username=options['username'])
+                self.run_benchmarks(user, options['repeat'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run_benchmarks(self, user, repeat):
+        moves_profile = user.data_profiles.get(provider=moves_service.name)
+        data_points = moves_profile.data_points
+        newest = data_points.latest_date()
+        self.stdout.write('{} data points, newest date {}'.format(data_points.count(), newest))
+
+        self.measure('latest() full row', repeat, lambda: data_points.latest('date').date)
+        self.measure('latest_date()', repeat, lambda: data_points.latest_date())
+        self.measure('30 days full segments', repeat, lambda: moves_service.transform_data_points(
+            data_points.in_range(newest - timedelta(days=30), newest)
+        ))
+        self.measure('30 days summary table', repeat, lambda: moves_service.get_summary_past_days(user, 30))
+        self.measure('day with trackPoints', repeat, lambda: moves_service.get_storyline_date(user, newest))
+        self.measure('day without trackPoints', repeat, lambda: moves_service.get_storyline_date(
+            user, newest, track_points=False
+        ))
+
+    def measure(self, name, repeat, query):
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            query()
+            timings.append(time.perf_counter() - start)
+        self.stdout.write('{:<28} best {:8.2f} ms  avg {:8.2f} ms'.format(
+            name, min(timings) * 1000, sum(timings) / len(timings) * 1000
+        ))
+
+    def create_synthetic_user(self, years):
+        user = User.objects.create(username='benchmark-{}'.format(int(time.time())))
+        moves_profile = DataProfile.objects.create(user=user, provider=moves_service.name)
+        day = date.today() - timedelta(days=365 * years)
+        while day <= date.today():
+            # through the importer, so the trackPoints end up packed in Tracks
+            moves_service.store_storyline_day(moves_profile, {'date': day.strftime('%Y%m%d'), 'segments': [{
+                'type': 'place', 'startTime': day.strftime('%Y%m%dT000000+0000'),
+                'lastUpdate': day.strftime('%Y%m%dT235959+0000'),
+                'place': {'location': {'lat': 52.52, 'lon': 13.40}}
+            }, self.synthetic_move(day)]})
+            day += timedelta(days=1)
+        with connection.cursor() as cursor:
+            for model in (DataPoint, Track):
+                cursor.execute('ANALYZE {}'.format(model._meta.db_table))
+        return user
+
+    def synthetic_move(self, day):
+        start = datetime(day.year, day.month, day.day, 8)
+        track_points = [{
+            'lat': 52.52 + i * 0.0001,
+            'lon': 13.40 + i * 0.0001,
+            'time': (start + timedelta(seconds=10 * i)).strftime('%Y%m%dT%H%M%S+0000')
+        } for i in range(500)]
+        return {
+            'type': 'move',
+            'startTime': track_points[0]['time'],
+            'endTime': track_points[-1]['time'],
+            'lastUpdate': track_points[-1]['time'],
+            'activities': [{
+                'activity': 'cycling',
+                'group': 'cycling',
+                'startTime': track_points[0]['time'],
+                'endTime': track_points[-1]['time'],
+                'duration': 4990.0,
+                'distance': 7000.0,
+                'calories': 200,
+                'trackPoints': track_points
+            }]
+        }
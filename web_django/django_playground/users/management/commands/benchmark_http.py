@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+import requests
+
+from ....services.http_client import HttpClient
+from ...tests.stub import MovesStubServer
+
+
+class Command(BaseCommand):
+    help = 'Compare per-call latency of bare requests calls and the pooled HttpClient against a local stub API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per client')
+
+    def handle(self, *args, **options):
+        client = HttpClient()
+        with MovesStubServer() as stub:
+            for path in ['/user/profile', '/user/storyline/daily?from=20180101&to=20180107&trackPoints=true']:
+                url = stub.url + path
+                self.stdout.write(path)
+                self.measure('requests.get (new connection)', options['requests'], lambda: requests.get(url))
+                self.measure('HttpClient.get (pooled)', options['requests'], lambda: client.get(url))
+
+    def measure(self, name, count, call):
+        start = time.perf_counter()
+        for i in range(count):
+            call().json()
+        elapsed = time.perf_counter() - start
+        self.stdout.write('{:<32} {:8.3f} ms per call'.format(name, elapsed / count * 1000))
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+import time
+
+from django.core.management.base import BaseCommand
+
+from ....services import timestamps
+
+
+class Command(BaseCommand):
+    help = 'Time parsing MOVES timestamps with strptime against the sliced and vectorized parsers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000000, help='Number of timestamps')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measured parser')
+
+    def handle(self, *args, **options):
+        values = self.synthetic_timestamps(options['count'])
+        self.stdout.write('{} timestamps'.format(len(values)))
+
+        self.measure('strptime', options['repeat'], lambda: [
+            datetime.strptime(value, '%Y%m%dT%H%M%S%z') for value in values
+        ])
+        self.measure('strptime epoch seconds', options['repeat'], lambda: [
+            datetime.strptime(value, '%Y%m%dT%H%M%S%z').timestamp() for value in values
+        ])
+        self.measure('timestamps.parse', options['repeat'], lambda: [timestamps.parse(value) for value in values])
+        self.measure('timestamps.epoch_seconds', options['repeat'], lambda: [
+            timestamps.epoch_seconds(value) for value in values
+        ])
+        self.measure('timestamps.epoch_array', options['repeat'], lambda: timestamps.epoch_array(values))
+
+    def measure(self, name, repeat, parse):
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            parse()
+            timings.append(time.perf_counter() - start)
+        self.stdout.write('{:<28} best {:10.2f} ms  avg {:10.2f} ms'.format(
+            name, min(timings) * 1000, sum(timings) / len(timings) * 1000
+        ))
+
+    def synthetic_timestamps(self, count):
+        """Points every 10 seconds, switching between a few UTC offsets like travelling users do."""
+        start = datetime(2017, 1, 1)
+        offsets = ['+0100', '+0200', '-0500', '+0000']
+        return [
+            (start + timedelta(seconds=10 * i)).strftime('%Y%m%dT%H%M%S') + offsets[(i // 10000) % len(offsets)]
+            for i in range(count)
+        ]
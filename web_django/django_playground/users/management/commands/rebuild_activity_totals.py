@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from ...models import DataProfile
+from ....services import moves_service
+
+
+class Command(BaseCommand):
+    help = 'Recompute the ActivityTotal table from the daily summaries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Only rebuild the totals of this user')
+        parser.add_argument('--summaries', action='store_true',
+                            help='Rebuild the daily summaries from the move segments first')
+
+    def handle(self, *args, **options):
+        profiles = DataProfile.objects.filter(provider=moves_service.name)
+        if options['username']:
+            profiles = profiles.filter(user__username=options['username'])
+
+        for moves_profile in profiles:
+            if options['summaries']:
+                days = moves_service.rebuild_daily_summaries(moves_profile)
+                self.stdout.write('{}: rebuilt summaries of {} days'.format(moves_profile, days))
+            totals = moves_service.rebuild_totals(moves_profile)
+            self.stdout.write('{}: rebuilt {} totals'.format(moves_profile, totals))
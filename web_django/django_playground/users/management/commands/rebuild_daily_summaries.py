@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from ...models import DataProfile
+from ....services import moves_service
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DailyActivitySummary table from the imported move segments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Only rebuild the summaries of this user')
+
+    def handle(self, *args, **options):
+        profiles = DataProfile.objects.filter(provider=moves_service.name)
+        if options['username']:
+            profiles = profiles.filter(user__username=options['username'])
+
+        for moves_profile in profiles:
+            days = moves_service.rebuild_daily_summaries(moves_profile)
+            self.stdout.write('{}: rebuilt summaries of {} days'.format(moves_profile, days))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from ...models import DataProfile
+from ....services import moves_service
+
+
+class Command(BaseCommand):
+    help = 'Recalculate stored speed/distance metrics of move DataPoints after an algorithm change.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Only recompute the data of this user')
+
+    def handle(self, *args, **options):
+        profiles = DataProfile.objects.filter(provider=moves_service.name)
+        if options['username']:
+            profiles = profiles.filter(user__username=options['username'])
+
+        for moves_profile in profiles:
+            updated = moves_service.recompute_metrics(moves_profile)
+            self.stdout.write('{}: recomputed {} data points'.format(moves_profile, updated))
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20180121_1947'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datapoint',
+            name='metrics_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Version of the derived metrics stored in data'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_datapoint_metrics_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivitySummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(editable=False, verbose_name='Date of the Summary')),
+                ('activity', models.CharField(editable=False, max_length=255, verbose_name='Name of the Activity')),
+                ('group', models.CharField(editable=False, max_length=255, verbose_name='Group of the Activity')),
+                ('duration', models.FloatField(default=0, verbose_name='Duration in seconds')),
+                ('distance', models.FloatField(default=0, verbose_name='Distance in meters')),
+                ('steps', models.IntegerField(default=0, verbose_name='Steps')),
+                ('calories', models.IntegerField(default=0, verbose_name='Calories')),
+                ('data_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to='users.DataProfile')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyactivitysummary',
+            unique_together=set([('data_profile', 'date', 'activity')]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_dailyactivitysummary'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='datapoint',
+            index_together=set([('data_profile', 'date', 'type')]),
+        ),
+    ]
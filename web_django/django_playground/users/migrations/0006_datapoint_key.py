@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import migrations, models
+
+
+def segment_key(date, segment):
+    # the key format of MovesService.segment_key when the keys were introduced
+    key = '{}|{}|{}|{}'.format(
+        date.strftime('%Y%m%d'), segment['type'], segment.get('startTime', ''), segment.get('lastUpdate', '')
+    )
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def fill_keys(apps, schema_editor):
+    """Key the existing DataPoints and drop duplicates imported twice."""
+    DataPoint = apps.get_model('users', 'DataPoint')
+    seen = set()
+    duplicates = []
+    for data_point in DataPoint.objects.order_by('id').iterator():
+        key = segment_key(data_point.date, dict(data_point.data, type=data_point.type))
+        if (data_point.data_profile_id, key) in seen:
+            duplicates.append(data_point.id)
+            continue
+        seen.add((data_point.data_profile_id, key))
+        DataPoint.objects.filter(id=data_point.id).update(key=key)
+    DataPoint.objects.filter(id__in=duplicates).delete()
+
+
+def summarize(segments):
+    # MovesService.calculate_summary at the time of this migration
+    summary = {}
+    for segment in segments:
+        for activity in segment.get('activities', []):
+            day = summary.setdefault(activity['activity'], dict(
+                group=activity.get('group', activity['activity']), duration=0, distance=0, steps=0, calories=0
+            ))
+            day['duration'] += activity.get('duration', 0)
+            day['distance'] += activity.get('distance', 0)
+            day['steps'] += activity.get('steps', 0)
+            day['calories'] += activity.get('calories', 0)
+    return summary
+
+
+def build_daily_summaries(apps, schema_editor):
+    """Summarize the days imported so far, without the duplicates dropped by fill_keys.
+
+    Later imports keep the summaries up to date.
+    """
+    DataPoint = apps.get_model('users', 'DataPoint')
+    DailyActivitySummary = apps.get_model('users', 'DailyActivitySummary')
+
+    DailyActivitySummary.objects.all().delete()
+    moves = DataPoint.objects.filter(type='move').order_by('data_profile_id', 'date').values_list(
+        'data_profile_id', 'date', 'data'
+    )
+    summaries = []
+    for (data_profile_id, date), rows in groupby(moves.iterator(), key=itemgetter(0, 1)):
+        for activity, day in summarize(row[2] for row in rows).items():
+            summaries.append(DailyActivitySummary(data_profile_id=data_profile_id, date=date, activity=activity, **day))
+        if len(summaries) >= 1000:
+            DailyActivitySummary.objects.bulk_create(summaries)
+            summaries = []
+    DailyActivitySummary.objects.bulk_create(summaries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_datapoint_index_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datapoint',
+            name='key',
+            field=models.CharField(editable=False, max_length=40, null=True, verbose_name='Key of the Segment Version'),
+        ),
+        migrations.RunPython(fill_keys, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='datapoint',
+            unique_together=set([('data_profile', 'key')]),
+        ),
+        migrations.RunPython(build_daily_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_datapoint_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataprofile',
+            name='imported_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Last import that changed data'),
+        ),
+    ]
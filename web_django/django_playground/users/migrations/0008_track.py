@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_tracks(apps, schema_editor):
+    """Index the trackPoints of the existing move DataPoints."""
+    DataPoint = apps.get_model('users', 'DataPoint')
+    Track = apps.get_model('users', 'Track')
+    tracks = []
+    for data_point in DataPoint.objects.filter(type='move').order_by('id').iterator():
+        # bounding boxes as MovesService.store_tracks computed them for the first Tracks
+        for position, activity in enumerate(data_point.data.get('activities', [])):
+            track_points = activity.get('trackPoints')
+            if not track_points:
+                continue
+            lats = [point['lat'] for point in track_points]
+            lons = [point['lon'] for point in track_points]
+            tracks.append(Track(
+                data_profile_id=data_point.data_profile_id, data_point_id=data_point.id, date=data_point.date,
+                activity=activity.get('activity', ''), position=position,
+                min_lat=min(lats), min_lon=min(lons), max_lat=max(lats), max_lon=max(lons)
+            ))
+    Track.objects.bulk_create(tracks, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_dataprofile_imported_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Track',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(editable=False, verbose_name='Date of the Track')),
+                ('activity', models.CharField(editable=False, max_length=255, verbose_name='Name of the Activity')),
+                ('position', models.PositiveSmallIntegerField(editable=False, verbose_name='Index of the Activity in the Segment')),
+                ('min_lat', models.FloatField(editable=False, verbose_name='Southern bound')),
+                ('min_lon', models.FloatField(editable=False, verbose_name='Western bound')),
+                ('max_lat', models.FloatField(editable=False, verbose_name='Northern bound')),
+                ('max_lon', models.FloatField(editable=False, verbose_name='Eastern bound')),
+                ('data_point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracks', to='users.DataPoint')),
+                ('data_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracks', to='users.DataProfile')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='track',
+            index_together=set([('data_profile', 'min_lon', 'max_lon', 'min_lat', 'max_lat'), ('data_profile', 'date')]),
+        ),
+        migrations.RunPython(fill_tracks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import date
+
+from django.db import migrations, models
+import numpy as np
+
+# proleptic gregorian ordinal of 1970-01-01
+EPOCH_ORDINAL = 719163
+
+
+def epoch_and_offset(value):
+    """Unix time and UTC offset in seconds of YYYYMMDDTHHMMSS followed by +HHMM, -HHMM or Z."""
+    # a standalone parser, strptime's %z rejects Z on python 3.5
+    suffix = value[15:]
+    if suffix == 'Z':
+        offset = 0
+    elif len(suffix) == 5 and suffix[0] in '+-':
+        offset = int(suffix[1:3]) * 3600 + int(suffix[3:5]) * 60
+        offset = -offset if suffix[0] == '-' else offset
+    else:
+        raise ValueError('Invalid MOVES timestamp: {!r}'.format(value))
+    days = date(int(value[0:4]), int(value[4:6]), int(value[6:8])).toordinal() - EPOCH_ORDINAL
+    seconds = days * 86400 + int(value[9:11]) * 3600 + int(value[11:13]) * 60 + int(value[13:15]) - offset
+    return seconds, offset
+
+
+def pack(track_points):
+    # the array layout of the Track fields added here
+    times = [epoch_and_offset(point['time']) for point in track_points]
+    return dict(
+        lats=np.array([point['lat'] for point in track_points], dtype=np.float64).tobytes(),
+        lons=np.array([point['lon'] for point in track_points], dtype=np.float64).tobytes(),
+        seconds=np.array([seconds for seconds, offset in times], dtype=np.float64).tobytes(),
+        utc_offsets=np.array([offset for seconds, offset in times], dtype=np.int32).tobytes(),
+    )
+
+
+def move_track_points(apps, schema_editor):
+    """Pack the trackPoints of the move DataPoints into their Tracks and drop them from the JSON."""
+    DataPoint = apps.get_model('users', 'DataPoint')
+    Track = apps.get_model('users', 'Track')
+    for data_point in DataPoint.objects.filter(type='move').order_by('id').iterator():
+        stripped = False
+        for position, activity in enumerate(data_point.data.get('activities', [])):
+            if 'trackPoints' not in activity:
+                continue
+            track_points = activity.pop('trackPoints')
+            stripped = True
+            if track_points:
+                Track.objects.filter(data_point_id=data_point.id, position=position).update(**pack(track_points))
+        if stripped:
+            DataPoint.objects.filter(id=data_point.id).update(data=data_point.data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_track'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='lats',
+            field=models.BinaryField(default=b'', verbose_name='Latitudes (float64)'),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='lons',
+            field=models.BinaryField(default=b'', verbose_name='Longitudes (float64)'),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='seconds',
+            field=models.BinaryField(default=b'', verbose_name='Epoch seconds (float64)'),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='utc_offsets',
+            field=models.BinaryField(default=b'', verbose_name='UTC offsets in seconds (int32)'),
+        ),
+        migrations.RunPython(move_track_points, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_track_arrays'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=16, verbose_name='State of the Import')),
+                ('from_date', models.DateField(null=True, verbose_name='First date to import')),
+                ('to_date', models.DateField(null=True, verbose_name='Last date to import')),
+                ('cursor', models.DateField(null=True, verbose_name='Last imported date')),
+                ('days_total', models.PositiveIntegerField(default=0, verbose_name='Days to import')),
+                ('days_done', models.PositiveIntegerField(default=0, verbose_name='Days imported')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Error of a failed import')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated at')),
+                ('data_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='users.DataProfile')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='importjob',
+            index_together=set([('data_profile', 'state')]),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def period_starts(date):
+    # the periods of ActivityTotal.period_starts when the table was created
+    return [
+        ('total', datetime.date(1970, 1, 1)),
+        ('year', date.replace(month=1, day=1)),
+        ('month', date.replace(day=1)),
+        ('week', date - datetime.timedelta(days=date.weekday())),
+    ]
+
+
+def sum_daily_summaries(apps, schema_editor):
+    """Build the totals from the daily summaries, replacing the totals in DataProfile.data.
+
+    The summaries were built from the deduplicated segments in 0006. The legacy
+    totals are only dropped once the profile has its ActivityTotal rows.
+    """
+    DataProfile = apps.get_model('users', 'DataProfile')
+    DailyActivitySummary = apps.get_model('users', 'DailyActivitySummary')
+    ActivityTotal = apps.get_model('users', 'ActivityTotal')
+
+    for data_profile in DataProfile.objects.all():
+        totals = {}
+        for summary in DailyActivitySummary.objects.filter(data_profile=data_profile).iterator():
+            for period, start in period_starts(summary.date):
+                total = totals.setdefault((period, start, summary.activity), dict(
+                    duration=0, distance=0, steps=0, calories=0
+                ))
+                total['duration'] += summary.duration
+                total['distance'] += summary.distance
+                total['steps'] += summary.steps
+                total['calories'] += summary.calories
+        ActivityTotal.objects.bulk_create([
+            ActivityTotal(data_profile=data_profile, period=period, start=start, activity=activity, **total)
+            for (period, start, activity), total in totals.items()
+        ])
+
+        if 'totals' in data_profile.data and totals:
+            del data_profile.data['totals']
+            data_profile.save(update_fields=['data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('total', 'Lifetime'), ('year', 'Year'), ('month', 'Month'), ('week', 'Week')], editable=False, max_length=16, verbose_name='Period')),
+                ('start', models.DateField(editable=False, verbose_name='First day of the Period')),
+                ('activity', models.CharField(editable=False, max_length=255, verbose_name='Name of the Activity')),
+                ('duration', models.FloatField(default=0, verbose_name='Duration in seconds')),
+                ('distance', models.FloatField(default=0, verbose_name='Distance in meters')),
+                ('steps', models.IntegerField(default=0, verbose_name='Steps')),
+                ('calories', models.IntegerField(default=0, verbose_name='Calories')),
+                ('data_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_totals', to='users.DataProfile')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='activitytotal',
+            unique_together=set([('data_profile', 'period', 'start', 'activity')]),
+        ),
+        migrations.RunPython(sum_daily_summaries, migrations.RunPython.noop),
+    ]
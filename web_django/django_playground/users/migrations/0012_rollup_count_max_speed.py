@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+import numpy as np
+
+
+def period_starts(date):
+    # the periods of the totals built in 0011
+    return [
+        ('total', datetime.date(1970, 1, 1)),
+        ('year', date.replace(month=1, day=1)),
+        ('month', date.replace(day=1)),
+        ('week', date - datetime.timedelta(days=date.weekday())),
+    ]
+
+
+def track_max_speed(lats, lons, seconds):
+    """Maximum speed in km/h between consecutive points of packed Track arrays.
+
+    The haversine distances and speeds of TrackService version 1, segments
+    without elapsed time are skipped.
+    """
+    lat = np.frombuffer(lats, dtype=np.float64)
+    lon = np.frombuffer(lons, dtype=np.float64)
+    elapsed = np.diff(np.frombuffer(seconds, dtype=np.float64))
+    valid = elapsed > 0
+    if len(lat) < 2 or not valid.any():
+        return 0
+    lat_radians = np.radians(lat)
+    sin_lat = np.sin(np.radians(np.diff(lat)) / 2)
+    sin_lon = np.sin(np.radians(np.diff(lon)) / 2)
+    a = sin_lat * sin_lat + np.cos(lat_radians[:-1]) * np.cos(lat_radians[1:]) * sin_lon * sin_lon
+    distance = 6371e3 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return max(float((distance[valid] / elapsed[valid]).max()) * 60 * 60 / 1000, 0)
+
+
+def count_activities(apps, schema_editor):
+    """Fill count and max_speed of the daily summaries from the move segments, and of the totals from them.
+
+    Segments imported before the metrics were stored (metrics_version 0) have
+    no max_speed, it is calculated from their Track arrays.
+    """
+    DataProfile = apps.get_model('users', 'DataProfile')
+    DataPoint = apps.get_model('users', 'DataPoint')
+    DailyActivitySummary = apps.get_model('users', 'DailyActivitySummary')
+    ActivityTotal = apps.get_model('users', 'ActivityTotal')
+    Track = apps.get_model('users', 'Track')
+
+    for data_profile in DataProfile.objects.all():
+        track_speeds = {}
+        tracks = Track.objects.filter(data_profile=data_profile, data_point__metrics_version=0).values_list(
+            'data_point_id', 'position', 'lats', 'lons', 'seconds'
+        )
+        for data_point_id, position, lats, lons, seconds in tracks.iterator():
+            track_speeds[(data_point_id, position)] = track_max_speed(lats, lons, seconds)
+
+        days = {}
+        moves = DataPoint.objects.filter(data_profile=data_profile, type='move').values_list('id', 'date', 'data')
+        for data_point_id, date, data in moves.iterator():
+            for position, activity in enumerate(data.get('activities', [])):
+                if 'max_speed' in activity:
+                    max_speed = activity['max_speed']
+                else:
+                    max_speed = track_speeds.get((data_point_id, position), 0)
+                day = days.setdefault((date, activity['activity']), dict(count=0, max_speed=0))
+                day['count'] += 1
+                day['max_speed'] = max(day['max_speed'], max_speed)
+
+        totals = {}
+        for (date, activity), day in days.items():
+            DailyActivitySummary.objects.filter(data_profile=data_profile, date=date, activity=activity).update(**day)
+            for period, start in period_starts(date):
+                total = totals.setdefault((period, start, activity), dict(count=0, max_speed=0))
+                total['count'] += day['count']
+                total['max_speed'] = max(total['max_speed'], day['max_speed'])
+        for (period, start, activity), total in totals.items():
+            ActivityTotal.objects.filter(
+                data_profile=data_profile, period=period, start=start, activity=activity
+            ).update(**total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_activitytotal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyactivitysummary',
+            name='count',
+            field=models.IntegerField(default=0, verbose_name='Number of Activities'),
+        ),
+        migrations.AddField(
+            model_name='dailyactivitysummary',
+            name='max_speed',
+            field=models.FloatField(default=0, verbose_name='Maximum speed in km/h'),
+        ),
+        migrations.AddField(
+            model_name='activitytotal',
+            name='count',
+            field=models.IntegerField(default=0, verbose_name='Number of Activities'),
+        ),
+        migrations.AddField(
+            model_name='activitytotal',
+            name='max_speed',
+            field=models.FloatField(default=0, verbose_name='Maximum speed in km/h'),
+        ),
+        migrations.RunPython(count_activities, migrations.RunPython.noop),
+    ]
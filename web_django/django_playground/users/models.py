@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models.expressions import RawSQL
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.postgres.fields import JSONField
@@ -30,11 +31,40 @@ class DataProfile(models.Model):
     provider = models.CharField(_('Name of Data Provider'), editable=False, max_length=255)
     auth_data = JSONField(default=dict)
     data = JSONField(default=dict)
+    imported_at = models.DateTimeField(_('Last import that changed data'), editable=False, null=True)
 
     def __str__(self):
         return "Data Profile of User {}".format(self.user.name)
 
 
+class DataPointQuerySet(models.QuerySet):
+
+    def in_range(self, from_date, to_date):
+        return self.filter(date__gte=from_date, date__lte=to_date)
+
+    def latest_date(self):
+        """Date of the newest DataPoint, read from the index without loading any data."""
+        return self.order_by('-date').values_list('date', flat=True).first()
+
+    def without_track_points(self):
+        """Skip the trackPoints of every activity when loading the data document.
+
+        The stripped document is available through DataPoint.segment, the full
+        data column is deferred.
+        """
+        column = '"{}"."data"'.format(self.model._meta.db_table)
+        return self.defer('data').annotate(data_without_track_points=RawSQL(
+            "CASE WHEN jsonb_typeof({column} -> 'activities') = 'array' "
+            "THEN jsonb_set({column}, '{{activities}}', COALESCE(("
+            "SELECT jsonb_agg(activity.value - 'trackPoints' ORDER BY activity.ordinality) "
+            "FROM jsonb_array_elements({column} -> 'activities') WITH ORDINALITY AS activity"
+            "), '[]'::jsonb)) "
+            "ELSE {column} END".format(column=column),
+            [],
+            output_field=JSONField()
+        ))
+
+
 class DataPoint(models.Model):
     data_profile = models.ForeignKey(
         DataProfile,
@@ -43,7 +73,236 @@ class DataPoint(models.Model):
     )
     date = models.DateField(_('Date for the Data Point'), editable=False, default=datetime.date.today)
     type = models.CharField(_('Type of Data Point'), editable=False, max_length=255)
+    key = models.CharField(_('Key of the Segment Version'), editable=False, max_length=40, null=True)
     data = JSONField(default=dict)
+    metrics_version = models.PositiveSmallIntegerField(
+        _('Version of the derived metrics stored in data'), editable=False, default=0
+    )
+
+    objects = DataPointQuerySet.as_manager()
+
+    class Meta:
+        # every read path filters a profile by date (and type), the index prefix covers both
+        index_together = [('data_profile', 'date', 'type')]
+        unique_together = [('data_profile', 'key')]
 
     def __str__(self):
         return "Data Point for a specific data provider and date {}".format(self.data_profile.user.name)
+
+    @property
+    def segment(self):
+        """The segment document, without trackPoints if they were skipped by the query."""
+        if hasattr(self, 'data_without_track_points'):
+            return self.data_without_track_points
+        return self.data
+
+
+class DailyActivitySummary(models.Model):
+    data_profile = models.ForeignKey(
+        DataProfile,
+        on_delete=models.CASCADE,
+        related_name='daily_summaries'
+    )
+    date = models.DateField(_('Date of the Summary'), editable=False)
+    activity = models.CharField(_('Name of the Activity'), editable=False, max_length=255)
+    group = models.CharField(_('Group of the Activity'), editable=False, max_length=255)
+    duration = models.FloatField(_('Duration in seconds'), default=0)
+    distance = models.FloatField(_('Distance in meters'), default=0)
+    steps = models.IntegerField(_('Steps'), default=0)
+    calories = models.IntegerField(_('Calories'), default=0)
+    count = models.IntegerField(_('Number of Activities'), default=0)
+    max_speed = models.FloatField(_('Maximum speed in km/h'), default=0)
+
+    class Meta:
+        unique_together = ('data_profile', 'date', 'activity')
+
+    def __str__(self):
+        return "Summary of {} on {} for {}".format(self.activity, self.date, self.data_profile.user.name)
+
+    def as_dict(self):
+        return dict(
+            activity=self.activity,
+            group=self.group,
+            duration=self.duration,
+            distance=self.distance,
+            steps=self.steps,
+            calories=self.calories,
+            count=self.count,
+            max_speed=self.max_speed
+        )
+
+
+class ActivityTotal(models.Model):
+    """Sums of the daily summaries of one activity over a period.
+
+    Every day counts towards the lifetime total and its year, month and (ISO,
+    starting monday) week, so the rows are rollups for long-range statistics.
+    They are updated with the difference of a day's old and new summaries (see
+    MovesService.update_daily_summary), the maximum speed is recomputed from
+    the daily summaries of a period when a day's maximum decreases.
+    """
+    TOTAL = 'total'
+    YEAR = 'year'
+    MONTH = 'month'
+    WEEK = 'week'
+    PERIODS = (
+        (TOTAL, _('Lifetime')),
+        (YEAR, _('Year')),
+        (MONTH, _('Month')),
+        (WEEK, _('Week')),
+    )
+    # start of the lifetime period
+    TOTAL_START = datetime.date(1970, 1, 1)
+
+    data_profile = models.ForeignKey(
+        DataProfile,
+        on_delete=models.CASCADE,
+        related_name='activity_totals'
+    )
+    period = models.CharField(_('Period'), choices=PERIODS, editable=False, max_length=16)
+    start = models.DateField(_('First day of the Period'), editable=False)
+    activity = models.CharField(_('Name of the Activity'), editable=False, max_length=255)
+    duration = models.FloatField(_('Duration in seconds'), default=0)
+    distance = models.FloatField(_('Distance in meters'), default=0)
+    steps = models.IntegerField(_('Steps'), default=0)
+    calories = models.IntegerField(_('Calories'), default=0)
+    count = models.IntegerField(_('Number of Activities'), default=0)
+    max_speed = models.FloatField(_('Maximum speed in km/h'), default=0)
+
+    class Meta:
+        unique_together = ('data_profile', 'period', 'start', 'activity')
+
+    def __str__(self):
+        return "Total of {} ({} {}) for {}".format(self.activity, self.period, self.start, self.data_profile.user.name)
+
+    @classmethod
+    def period_starts(cls, date):
+        """(period, start) of every period a day counts towards."""
+        return [
+            (cls.TOTAL, cls.TOTAL_START),
+            (cls.YEAR, date.replace(month=1, day=1)),
+            (cls.MONTH, date.replace(day=1)),
+            (cls.WEEK, date - datetime.timedelta(days=date.weekday())),
+        ]
+
+    @classmethod
+    def period_end(cls, period, start):
+        """First day after a period, None for the lifetime."""
+        if period == cls.YEAR:
+            return start.replace(year=start.year + 1)
+        if period == cls.MONTH:
+            return (start + datetime.timedelta(days=31)).replace(day=1)
+        if period == cls.WEEK:
+            return start + datetime.timedelta(days=7)
+        return None
+
+    def as_dict(self):
+        return dict(
+            activity=self.activity,
+            start=self.start.isoformat(),
+            duration=self.duration,
+            distance=self.distance,
+            steps=self.steps,
+            calories=self.calories,
+            count=self.count,
+            max_speed=self.max_speed
+        )
+
+
+class TrackQuerySet(models.QuerySet):
+    def in_bounds(self, west, south, east, north):
+        """Tracks whose bounding box intersects the given one."""
+        return self.filter(min_lon__lte=east, max_lon__gte=west, min_lat__lte=north, max_lat__gte=south)
+
+
+class Track(models.Model):
+    """The trackPoints of one activity as packed arrays, with their bounding box.
+
+    Move DataPoints store their activities without trackPoints, the arrays are
+    numpy buffers (see TrackService.pack) and the bounding box is the spatial
+    index for map tiles.
+    """
+    data_profile = models.ForeignKey(
+        DataProfile,
+        on_delete=models.CASCADE,
+        related_name='tracks'
+    )
+    data_point = models.ForeignKey(
+        DataPoint,
+        on_delete=models.CASCADE,
+        related_name='tracks'
+    )
+    date = models.DateField(_('Date of the Track'), editable=False)
+    activity = models.CharField(_('Name of the Activity'), editable=False, max_length=255)
+    position = models.PositiveSmallIntegerField(_('Index of the Activity in the Segment'), editable=False)
+    min_lat = models.FloatField(_('Southern bound'), editable=False)
+    min_lon = models.FloatField(_('Western bound'), editable=False)
+    max_lat = models.FloatField(_('Northern bound'), editable=False)
+    max_lon = models.FloatField(_('Eastern bound'), editable=False)
+    lats = models.BinaryField(_('Latitudes (float64)'), default=b'')
+    lons = models.BinaryField(_('Longitudes (float64)'), default=b'')
+    seconds = models.BinaryField(_('Epoch seconds (float64)'), default=b'')
+    utc_offsets = models.BinaryField(_('UTC offsets in seconds (int32)'), default=b'')
+
+    objects = TrackQuerySet.as_manager()
+
+    class Meta:
+        # tiles filter a profile by bounding box, optionally by date
+        index_together = [('data_profile', 'min_lon', 'max_lon', 'min_lat', 'max_lat'), ('data_profile', 'date')]
+
+    def __str__(self):
+        return "Track of {} on {} for {}".format(self.activity, self.date, self.data_profile.user.name)
+
+
+class ImportJob(models.Model):
+    """A background import of a data profile, with the last committed date to resume from.
+
+    There is at most one queued or running job per profile (see
+    MovesService.start_import), cancelled jobs stop after the current window.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATES = (
+        (QUEUED, _('Queued')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+        (CANCELLED, _('Cancelled')),
+    )
+    ACTIVE_STATES = (QUEUED, RUNNING)
+
+    data_profile = models.ForeignKey(
+        DataProfile,
+        on_delete=models.CASCADE,
+        related_name='import_jobs'
+    )
+    state = models.CharField(_('State of the Import'), choices=STATES, default=QUEUED, max_length=16)
+    from_date = models.DateField(_('First date to import'), null=True)
+    to_date = models.DateField(_('Last date to import'), null=True)
+    cursor = models.DateField(_('Last imported date'), null=True)
+    days_total = models.PositiveIntegerField(_('Days to import'), default=0)
+    days_done = models.PositiveIntegerField(_('Days imported'), default=0)
+    error = models.TextField(_('Error of a failed import'), blank=True, default='')
+    created_at = models.DateTimeField(_('Created at'), auto_now_add=True)
+    # heartbeat of the worker, updated after every stored window
+    updated_at = models.DateTimeField(_('Updated at'), auto_now=True)
+
+    class Meta:
+        index_together = [('data_profile', 'state')]
+
+    def __str__(self):
+        return "Import of {} ({})".format(self.data_profile.user.name, self.state)
+
+    @property
+    def is_active(self):
+        return self.state in self.ACTIVE_STATES
+
+    @property
+    def progress(self):
+        """Imported share of the days in percent."""
+        if not self.days_total:
+            return 0
+        return min(100, int(self.days_done * 100 / self.days_total))
@@ -1,6 +1,8 @@
 from django import template
 from django.contrib.gis.measure import Distance
-from datetime import datetime, timedelta
+from datetime import timedelta
+
+from ...services import timestamps
 
 register = template.Library()
 
@@ -50,4 +52,4 @@ def calories_to_watthour(calories):
 
 @register.filter(name='datestring_to_date')
 def datestring_to_date(date_string):
-    return datetime.strptime(date_string, '%Y%m%dT%H%M%S%z')
+    return timestamps.parse(date_string)
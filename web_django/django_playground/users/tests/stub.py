@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+import json
+import threading
+import time
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, avoid delayed ACK stalls on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        self.server.record(url.path, query, self.client_address)
+
+        status, body, headers = self.server.respond(url.path, query)
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        self.do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MovesStubServer(ThreadingMixIn, HTTPServer):
+    """Local stand-in for the MOVES API, used by tests and benchmarks.
+
+    Serves a generated storyline for /user/storyline/daily (single day or from/to
+    ranges) and records every request and the client connections. Responses queued with `fail` are served
+    first, to simulate errors. Runs in a daemon thread:
+
+        with MovesStubServer() as stub:
+            settings.MOVES_API['api'] = stub.url
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay=0):
+        super(MovesStubServer, self).__init__(('127.0.0.1', 0), StubRequestHandler)
+        self.delay = delay
+        self.requests = []
+        self.connections = set()
+        self.requests_lock = threading.Lock()
+        self.failures = []
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def record(self, path, query, client_address=None):
+        with self.requests_lock:
+            self.requests.append((path, query))
+            if client_address is not None:
+                self.connections.add(client_address)
+
+    def fail(self, status, times=1, headers=None):
+        """Answer the next `times` requests with an error status."""
+        with self.requests_lock:
+            self.failures.extend([(status, {'error': 'stub failure'}, headers or {})] * times)
+
+    def respond(self, path, query):
+        if self.delay:
+            time.sleep(self.delay)
+        with self.requests_lock:
+            if self.failures:
+                return self.failures.pop(0)
+        if path.startswith('/user/storyline/daily'):
+            return 200, self.storyline(path, query), {}
+        if path == '/user/profile':
+            return 200, {'userId': 1, 'profile': {'firstDate': '20180101', 'currentTimeZone': {'id': 'UTC'}}}, {}
+        return 404, {'error': 'not found'}, {}
+
+    def storyline(self, path, query):
+        if 'from' in query:
+            from_date = datetime.strptime(query['from'], '%Y%m%d')
+            to_date = datetime.strptime(query['to'], '%Y%m%d')
+        else:
+            from_date = to_date = datetime.strptime(path.rsplit('/', 1)[1], '%Y%m%d')
+
+        days = []
+        while from_date <= to_date:
+            days.append(self.storyline_day(from_date))
+            from_date += timedelta(days=1)
+        return days
+
+    def storyline_day(self, day):
+        track_points = [{
+            'lat': 52.52 + i * 0.001,
+            'lon': 13.40 + i * 0.001,
+            'time': (day + timedelta(hours=8, minutes=i)).strftime('%Y%m%dT%H%M%S+0000')
+        } for i in range(10)]
+        return {
+            'date': day.strftime('%Y%m%d'),
+            'segments': [{
+                'type': 'move',
+                'startTime': track_points[0]['time'],
+                'endTime': track_points[-1]['time'],
+                'lastUpdate': day.strftime('%Y%m%dT235959+0000'),
+                'activities': [{
+                    'activity': 'walking',
+                    'group': 'walking',
+                    'startTime': track_points[0]['time'],
+                    'endTime': track_points[-1]['time'],
+                    'duration': 540.0,
+                    'distance': 1200.0,
+                    'steps': 1500,
+                    'calories': 60,
+                    'trackPoints': track_points
+                }]
+            }]
+        }
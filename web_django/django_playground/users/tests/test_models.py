@@ -17,3 +17,39 @@ class TestUser(TestCase):
             self.user.get_absolute_url(),
             '/users/testuser/'
         )
+
+
+class TestDataPointQuerySet(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user()
+        self.data_profile = self.user.data_profiles.create(provider='moves')
+
+    def test_without_track_points(self):
+        move = {
+            'type': 'move',
+            'lastUpdate': '20180120T120000Z',
+            'activities': [
+                {'activity': 'cycling', 'distance': 1500.0, 'trackPoints': [{'lat': 52.52, 'lon': 13.405}]},
+                # activities without a track have no trackPoints
+                {'activity': 'walking', 'distance': 300.0},
+            ]
+        }
+        place = {'type': 'place', 'place': {'location': {'lat': 52.52, 'lon': 13.405}}}
+        self.data_profile.data_points.create(type='move', data=move)
+        self.data_profile.data_points.create(type='place', data=place)
+
+        data_points = self.data_profile.data_points.without_track_points().order_by('id')
+
+        self.assertEqual(data_points[0].segment, {
+            'type': 'move',
+            'lastUpdate': '20180120T120000Z',
+            'activities': [
+                {'activity': 'cycling', 'distance': 1500.0},
+                {'activity': 'walking', 'distance': 300.0},
+            ]
+        })
+        self.assertEqual(data_points[1].segment, place)
+        self.assertEqual(data_points[0].get_deferred_fields(), {'data'})
+        # the full document is still loaded on access
+        self.assertEqual(data_points[0].data, move)
@@ -0,0 +1,764 @@
+import gzip
+import json
+import math
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from test_plus.test import TestCase
+
+from ..models import ActivityTotal, DataProfile, ImportJob
+from ...services import (
+    MovesApiError, chart_service, moves_service, tile_service, track_service, utils_service, weather_service
+)
+from ...services import timestamps
+from ...services.http_client import HttpClient
+from ...services.ratelimit import RateLimiter
+from .stub import MovesStubServer
+
+
+def reference_distances(activity):
+    """The original per-trackPoint loop the vectorized engine has to match."""
+    R = 6371e3
+    max_speed = 0
+    avg_speed = 0
+    speed_iter = 0
+    last = None
+    for track_point in activity['trackPoints']:
+        current_time = datetime.strptime(track_point['time'], '%Y%m%dT%H%M%S%z')
+        if last is not None:
+            last_lat, last_lon, last_time = last
+            lat1 = math.radians(last_lat)
+            lat2 = math.radians(track_point['lat'])
+            lat_distance = math.radians(track_point['lat'] - last_lat)
+            lon_distance = math.radians(track_point['lon'] - last_lon)
+            a = math.sin(lat_distance/2) * math.sin(lat_distance/2) + \
+                math.cos(lat1) * math.cos(lat2) * math.sin(lon_distance/2) * math.sin(lon_distance/2)
+            d = R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+            seconds = (current_time - last_time).total_seconds()
+            if seconds > 0:
+                km_per_hour = d/seconds*60*60/1000
+                track_point['speed'] = d/seconds
+                track_point['speed_kmh'] = km_per_hour
+                track_point['distance'] = d
+                avg_speed += km_per_hour
+                speed_iter += 1
+                max_speed = max(max_speed, km_per_hour)
+        last = (track_point['lat'], track_point['lon'], current_time)
+
+    activity['max_speed'] = max_speed
+    activity['avg_speed'] = avg_speed/speed_iter if speed_iter else 0
+    return activity
+
+
+def make_activity():
+    return {
+        'activity': 'cycling',
+        'startTime': '20180120T101500+0100',
+        'endTime': '20180120T092000+0000',
+        'trackPoints': [
+            {'lat': 52.5200, 'lon': 13.4050, 'time': '20180120T101500+0100'},
+            {'lat': 52.5210, 'lon': 13.4070, 'time': '20180120T101530+0100'},
+            # same timestamp as before: no speed for this point
+            {'lat': 52.5215, 'lon': 13.4080, 'time': '20180120T101530+0100'},
+            {'lat': 52.5250, 'lon': 13.4150, 'time': '20180120T101700+0100'},
+            {'lat': 52.5300, 'lon': 13.4200, 'time': '20180120T092000+0000'},
+        ]
+    }
+
+
+class TestTrackService(TestCase):
+
+    def test_calculate_activity_matches_reference(self):
+        expected = reference_distances(make_activity())
+        actual = track_service.calculate_activity(make_activity())
+
+        self.assertAlmostEqual(actual['max_speed'], expected['max_speed'])
+        self.assertAlmostEqual(actual['avg_speed'], expected['avg_speed'])
+        for actual_point, expected_point in zip(actual['trackPoints'], expected['trackPoints']):
+            self.assertEqual(sorted(actual_point.keys()), sorted(expected_point.keys()))
+            for key in ('speed', 'speed_kmh', 'distance'):
+                if key in expected_point:
+                    self.assertAlmostEqual(actual_point[key], expected_point[key])
+
+    def test_calculate_activity_without_track_points(self):
+        activity = track_service.calculate_activity({'activity': 'walking'})
+        self.assertEqual(activity['max_speed'], 0)
+        self.assertEqual(activity['avg_speed'], 0)
+
+    def test_simplify_drops_points_on_a_line(self):
+        lat = [52.52 + i * 0.001 for i in range(100)]
+        lon = [13.40 + i * 0.001 for i in range(100)]
+        lat[50] += 0.001  # ~110m detour, its neighbours are needed to draw the spike
+
+        self.assertEqual(track_service.simplify(lat, lon, tolerance=10).tolist(), [0, 49, 50, 51, 99])
+        self.assertEqual(track_service.simplify(lat, lon, zoom=10).tolist(), [0, 99])
+        self.assertEqual(len(track_service.simplify(lat, lon)), 100)
+
+    def test_geojson_activity_keeps_times_aligned(self):
+        activity = dict(make_activity(), distance=1500.0, duration=300.0)
+        geojson = utils_service.geojson_activity(activity, tolerance=50)
+
+        coordinates = geojson['geometry']['coordinates']
+        times = geojson['properties']['times']
+        self.assertLess(len(coordinates), len(activity['trackPoints']))
+        self.assertEqual(len(coordinates), len(times))
+        for coordinate, time_string in zip(coordinates, times):
+            point = next(p for p in activity['trackPoints'] if p['time'] == time_string)
+            self.assertEqual(coordinate, [point['lon'], point['lat']])
+
+    def test_geojson_stream_is_a_feature_collection(self):
+        day = make_storyline_day()
+        chunks = list(utils_service.geojson_stream(utils_service.geojson_features(day['segments'])))
+
+        geojson = json.loads(''.join(chunks))
+        self.assertEqual(geojson['type'], 'FeatureCollection')
+        self.assertEqual([f['geometry']['type'] for f in geojson['features']], ['Point', 'LineString'])
+        self.assertEqual(json.loads(''.join(utils_service.geojson_stream([]))), {
+            'type': 'FeatureCollection', 'features': []
+        })
+
+
+class TestTimestamps(TestCase):
+
+    values = ['20180120T101500+0100', '20171231T235959-0530', '20000229T000000+0000', '19991231T120000+1345']
+
+    def test_parse_matches_strptime(self):
+        for value in self.values:
+            expected = datetime.strptime(value, '%Y%m%dT%H%M%S%z')
+            self.assertEqual(timestamps.parse(value), expected)
+            self.assertEqual(timestamps.parse(value).utcoffset(), expected.utcoffset())
+            self.assertEqual(timestamps.epoch_seconds(value), expected.timestamp())
+        self.assertEqual(timestamps.parse('20180120'), datetime(2018, 1, 20))
+        self.assertEqual(timestamps.epoch_seconds('20180120T091500Z'), timestamps.epoch_seconds('20180120T101500+0100'))
+        for value in ('2018012', '20180120 101500+0100', '20181320T101500+0100'):
+            with self.assertRaises(ValueError):
+                timestamps.parse(value)
+
+    def test_epoch_array_and_format_round_trip(self):
+        seconds, offsets = timestamps.epoch_array(self.values + ['20180120T091500Z'])
+
+        expected = [datetime.strptime(value, '%Y%m%dT%H%M%S%z') for value in self.values]
+        self.assertEqual(seconds.tolist()[:-1], [e.timestamp() for e in expected])
+        self.assertEqual(offsets.tolist(), [int(e.utcoffset().total_seconds()) for e in expected] + [0])
+        self.assertEqual([timestamps.format_time(s, o) for s, o in zip(seconds.tolist(), offsets.tolist())],
+                         self.values + ['20180120T091500+0000'])
+
+
+class TestChartService(TestCase):
+
+    def test_downsample_keeps_ends_and_peaks(self):
+        distances = list(range(1000))
+        speeds = [10.0] * 1000
+        speeds[567] = 80.0
+
+        sampled_distances, sampled_speeds = chart_service.downsample(distances, speeds, 50)
+
+        self.assertEqual(len(sampled_distances), 50)
+        self.assertEqual((sampled_distances[0], sampled_distances[-1]), (0, 999))
+        self.assertIn(80.0, sampled_speeds)
+
+    def test_downsample_short_series_unchanged(self):
+        self.assertEqual(chart_service.downsample([1, 2, 3], [4, 5, 6], 50), ([1, 2, 3], [4, 5, 6]))
+
+
+def make_storyline_day(last_update='20180120T120000Z'):
+    return {
+        'date': '20180120',
+        'segments': [
+            {
+                'type': 'place',
+                'startTime': '20180120T000000+0100',
+                'endTime': '20180120T101500+0100',
+                'lastUpdate': last_update,
+                'place': {'location': {'lat': 52.52, 'lon': 13.405}}
+            },
+            {
+                'type': 'move',
+                'startTime': '20180120T101500+0100',
+                'endTime': '20180120T092000+0000',
+                'lastUpdate': last_update,
+                'activities': [dict(
+                    make_activity(), group='cycling', duration=300.0, distance=1500.0, calories=40
+                )]
+            },
+        ]
+    }
+
+
+class TestStoreStoryline(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # loaded days are memoized in the process, across tests
+        moves_service.day_memo.clear()
+        self.user = self.make_user()
+        self.moves_profile = self.user.data_profiles.create(provider=moves_service.name)
+
+    def test_store_storyline_is_idempotent(self):
+        self.assertTrue(moves_service.store_storyline_day(self.moves_profile, make_storyline_day()))
+        self.assertFalse(moves_service.store_storyline_day(self.moves_profile, make_storyline_day()))
+
+        self.assertEqual(self.moves_profile.data_points.count(), 2)
+        self.assertEqual(self.moves_profile.daily_summaries.get().distance, 1500.0)
+
+    def test_store_storyline_replaces_updated_segments(self):
+        moves_service.store_storyline_day(self.moves_profile, make_storyline_day())
+        moves_service.store_storyline_day(self.moves_profile, make_storyline_day('20180121T080000Z'))
+
+        self.assertEqual(self.moves_profile.data_points.count(), 2)
+        self.assertEqual(
+            set(data_point.data['lastUpdate'] for data_point in self.moves_profile.data_points.all()),
+            {'20180121T080000Z'}
+        )
+
+    def test_store_storyline_keeps_refreshed_token(self):
+        DataProfile.objects.filter(id=self.moves_profile.id).update(auth_data={'access_token': 'refreshed'})
+        moves_service.store_storyline(self.moves_profile, [make_storyline_day()])
+        imported_at = self.moves_profile.imported_at
+        moves_service.store_storyline(self.moves_profile, [make_storyline_day()])
+
+        self.moves_profile.refresh_from_db()
+        self.assertEqual(self.moves_profile.auth_data, {'access_token': 'refreshed'})
+        self.assertIsNotNone(imported_at)
+        self.assertEqual(self.moves_profile.imported_at, imported_at)
+
+    def test_track_points_are_stored_packed(self):
+        moves_service.store_storyline_day(self.moves_profile, make_storyline_day())
+
+        move = self.moves_profile.data_points.get(type='move')
+        self.assertNotIn('trackPoints', move.data['activities'][0])
+        self.assertEqual(move.tracks.get().position, 0)
+
+        activity = moves_service.get_activities_date(self.user, date(2018, 1, 20))[0]
+        expected = track_service.calculate_activity(make_activity())
+        self.assertEqual(activity['trackPoints'], expected['trackPoints'])
+
+    def test_empty_track_points_are_kept(self):
+        day = make_storyline_day()
+        day['segments'][1]['activities'][0]['trackPoints'] = []
+        moves_service.store_storyline_day(self.moves_profile, day)
+
+        self.assertFalse(self.moves_profile.tracks.exists())
+        activity = moves_service.get_activities_date(self.user, date(2018, 1, 20))[0]
+        self.assertEqual(activity['trackPoints'], [])
+
+    def test_load_day_is_memoized_per_data_version(self):
+        day = date(2018, 1, 20)
+        moves_service.store_storyline_day(self.moves_profile, make_storyline_day())
+
+        with mock.patch.object(moves_service, 'transform_data_points',
+                               wraps=moves_service.transform_data_points) as transform:
+            first = moves_service.load_day(self.moves_profile, day)
+            self.assertIs(moves_service.load_day(self.moves_profile, day), first)
+            self.assertEqual(transform.call_count, 1)
+            self.assertEqual([activity['startTime'] for activity in first], ['20180120T101500+0100'])
+
+            moves_service.store_storyline_day(self.moves_profile, make_storyline_day('20180121T080000Z'))
+            moves_service.load_day(self.moves_profile, day)
+            self.assertEqual(transform.call_count, 2)
+
+    @mock.patch('django_playground.services.weather.Channel')
+    def test_weather_prefetch_of_move_without_activities(self, channel):
+        day = make_storyline_day()
+        del day['segments'][1]['activities']
+        with mock.patch.dict(moves_service.weather.config, prefetch=True):
+            self.assertTrue(moves_service.store_storyline_day(self.moves_profile, day))
+        channel.assert_not_called()
+
+    def test_import_builds_day_geojson(self):
+        day = date(2018, 1, 20)
+        moves_service.store_storyline_day(self.moves_profile, make_storyline_day())
+        key = moves_service.day_geojson_key(self.moves_profile, day)
+
+        geojson = json.loads(gzip.decompress(cache.get(key)['body']).decode('utf-8'))
+        self.assertEqual(len(geojson['features']), 2)
+
+        moves_service.store_storyline_day(self.moves_profile, make_storyline_day('20180121T080000Z'))
+        self.assertNotEqual(moves_service.day_geojson_key(self.moves_profile, day), key)
+
+    def test_day_geojson_is_optional_for_the_import(self):
+        day = make_storyline_day()
+        day['segments'][1]['activities'].append(dict(activity='walking', group='walking', duration=60.0, distance=50.0))
+        self.assertTrue(moves_service.store_storyline_day(self.moves_profile, day))
+        geojson = moves_service.get_day_geojson(self.moves_profile, date(2018, 1, 20))
+        features = json.loads(gzip.decompress(geojson['body']).decode('utf-8'))['features']
+        self.assertEqual(features[2]['geometry'], {'type': 'LineString', 'coordinates': []})
+
+        updated = make_storyline_day('20180121T080000Z')
+        with mock.patch.object(moves_service, 'build_day_geojson', side_effect=ValueError('broken')):
+            with self.assertLogs('django_playground.services.moves', 'ERROR'):
+                self.assertTrue(moves_service.store_storyline_day(self.moves_profile, updated))
+        self.assertEqual(self.moves_profile.data_points.count(), 2)
+
+    def test_totals_are_updated_by_delta(self):
+        moves_service.store_storyline_day(self.moves_profile, make_storyline_day())
+        # a re-imported segment replaces its old version instead of counting twice
+        updated = make_storyline_day('20180121T080000Z')
+        updated['segments'][1]['activities'][0]['distance'] = 2000.0
+        moves_service.store_storyline_day(self.moves_profile, updated)
+
+        totals = moves_service.get_totals(self.moves_profile)
+        self.assertEqual(totals['cycling']['distance'], 2000.0)
+        self.assertEqual(totals['cycling']['calories'], 40)
+        self.assertEqual(totals['walking']['distance'], 0)
+        self.assertEqual(
+            moves_service.get_totals(self.moves_profile, ActivityTotal.WEEK, date(2018, 1, 15))['cycling']['distance'],
+            2000.0
+        )
+
+        fields = ('period', 'start', 'distance', 'count', 'max_speed')
+        expected = list(self.moves_profile.activity_totals.order_by('period').values_list(*fields))
+        self.assertEqual(len(expected), 4)
+        moves_service.rebuild_totals(self.moves_profile)
+        self.assertEqual(list(self.moves_profile.activity_totals.order_by('period').values_list(*fields)), expected)
+
+    def test_rollups_follow_decreasing_max_speed(self):
+        moves_service.store_storyline_day(self.moves_profile, make_storyline_day())
+        max_speed = self.moves_profile.daily_summaries.get().max_speed
+        self.assertGreater(max_speed, 0)
+
+        # the re-imported move only has its first two trackPoints left, which are slower
+        updated = make_storyline_day('20180121T080000Z')
+        del updated['segments'][1]['activities'][0]['trackPoints'][2:]
+        moves_service.store_storyline_day(self.moves_profile, updated)
+        slower = self.moves_profile.daily_summaries.get().max_speed
+        self.assertLess(slower, max_speed)
+
+        overview = moves_service.get_year_overview(self.moves_profile, 2018)
+        self.assertEqual(overview['totals']['cycling']['max_speed'], slower)
+        self.assertEqual(overview['totals']['cycling']['count'], 1)
+        self.assertEqual([month['start'] for month in overview['months']], ['2018-01-01'])
+        self.assertEqual([week['start'] for week in overview['weeks']], ['2018-01-15'])
+        self.assertEqual(overview['weeks'][0]['totals']['cycling']['max_speed'], slower)
+        self.assertEqual(moves_service.get_rollup_years(self.moves_profile), [2018])
+
+
+class TestMoveMetrics(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.make_user()
+        self.moves_profile = self.user.data_profiles.create(provider=moves_service.name)
+        moves_service.store_storyline_day(self.moves_profile, make_storyline_day())
+        self.expected = reference_distances(make_activity())
+
+    def test_metrics_are_stored_on_import(self):
+        move = self.moves_profile.data_points.get(type='move')
+
+        self.assertEqual(move.metrics_version, track_service.version)
+        self.assertAlmostEqual(move.data['activities'][0]['max_speed'], self.expected['max_speed'])
+        self.assertAlmostEqual(move.data['activities'][0]['avg_speed'], self.expected['avg_speed'])
+
+    def test_stored_metrics_are_read_without_recalculation(self):
+        with mock.patch.object(moves_service, 'calculate_distances',
+                               wraps=moves_service.calculate_distances) as calculate:
+            day = moves_service.get_data_points_date(self.user, date(2018, 1, 20))
+            self.assertEqual(calculate.call_count, 0)
+
+            self.moves_profile.data_points.filter(type='move').update(metrics_version=0)
+            moves_service.get_data_points_date(self.user, date(2018, 1, 20))
+            self.assertEqual(calculate.call_count, 1)
+
+        move = next(segment for segment in day[0]['segments'] if segment['type'] == 'move')
+        self.assertAlmostEqual(move['activities'][0]['max_speed'], self.expected['max_speed'])
+
+    def test_command_recomputes_outdated_metrics(self):
+        move = self.moves_profile.data_points.get(type='move')
+        move.data['activities'][0]['max_speed'] = 0
+        move.metrics_version = 0
+        move.save()
+        current = self.moves_profile.data_points.get(type='place')
+        # summaries and totals of the old metrics
+        self.moves_profile.daily_summaries.update(max_speed=0)
+        self.moves_profile.activity_totals.update(max_speed=0)
+
+        call_command('recompute_move_metrics', stdout=StringIO())
+
+        move.refresh_from_db()
+        self.assertEqual(move.metrics_version, track_service.version)
+        self.assertAlmostEqual(move.data['activities'][0]['max_speed'], self.expected['max_speed'])
+        self.assertNotIn('trackPoints', move.data['activities'][0])
+        self.assertEqual(self.moves_profile.data_points.get(type='place').data, current.data)
+        self.assertAlmostEqual(self.moves_profile.daily_summaries.get().max_speed, self.expected['max_speed'])
+        self.assertAlmostEqual(moves_service.get_totals(self.moves_profile)['cycling']['max_speed'],
+                               self.expected['max_speed'])
+
+
+class TestDailySummaries(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.make_user()
+        self.moves_profile = self.user.data_profiles.create(provider=moves_service.name)
+
+    def make_day(self):
+        day = make_storyline_day()
+        move = day['segments'][1]
+        walk = dict(activity='walking', group='walking', duration=600.0, distance=800.0, steps=1000, calories=50)
+        move['activities'] += [walk, dict(walk, duration=300.0, distance=400.0, steps=500, calories=20)]
+        return day
+
+    def test_import_writes_summaries(self):
+        moves_service.store_storyline_day(self.moves_profile, self.make_day())
+
+        summaries = dict((s.activity, s) for s in self.moves_profile.daily_summaries.filter(date=date(2018, 1, 20)))
+        self.assertEqual(sorted(summaries), ['cycling', 'walking'])
+        self.assertEqual(summaries['walking'].distance, 1200.0)
+        self.assertEqual(summaries['walking'].steps, 1500)
+        self.assertEqual(summaries['cycling'].calories, 40)
+
+        day = moves_service.get_summary_date(self.user, date(2018, 1, 20))
+        self.assertEqual(day[0]['date'], '20180120')
+        self.assertEqual(sorted(s['activity'] for s in day[0]['summary']), ['cycling', 'walking'])
+
+    def test_command_rebuilds_summaries(self):
+        moves_service.store_storyline_day(self.moves_profile, self.make_day())
+        expected = list(self.moves_profile.daily_summaries.order_by('activity').values_list('activity', 'distance'))
+        self.moves_profile.daily_summaries.all().delete()
+        self.moves_profile.refresh_from_db()
+        imported_at = self.moves_profile.imported_at
+
+        call_command('rebuild_daily_summaries', stdout=StringIO())
+
+        # cached charts are keyed by imported_at
+        self.moves_profile.refresh_from_db()
+        self.assertIsNotNone(self.moves_profile.imported_at)
+        self.assertNotEqual(self.moves_profile.imported_at, imported_at)
+
+        self.assertEqual(
+            list(self.moves_profile.daily_summaries.order_by('activity').values_list('activity', 'distance')), expected
+        )
+
+
+class TestTileService(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user()
+        self.moves_profile = self.user.data_profiles.create(provider=moves_service.name)
+
+    def test_line_parts_crop_to_tile(self):
+        tile_x = np.array([0, 100, 10000, 20000, 30000, 100, 100, 200])
+        tile_y = np.array([0, 100, 10000, 20000, 30000, 100, 100, 200])
+
+        self.assertEqual(tile_service.line_parts(tile_x, tile_y), [
+            ([0, 100, 10000], [0, 100, 10000]),
+            ([30000, 100, 200], [30000, 100, 200]),
+        ])
+
+    def test_render_tracks_in_tile(self):
+        moves_service.store_storyline_day(self.moves_profile, make_storyline_day())
+        track = self.moves_profile.tracks.get()
+        self.assertEqual((track.min_lat, track.max_lat), (52.52, 52.53))
+
+        # zoom 12 tile of Berlin Mitte, the track starts in it
+        tile = tile_service.render(self.moves_profile, 12, 2200, 1343)
+        self.assertIn(b'tracks', tile)
+        self.assertIn(b'cycling', tile)
+        self.assertEqual(tile_service.render(self.moves_profile, 12, 0, 0), b'')
+
+
+class TestWeatherService(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.activity = make_activity()
+
+    @mock.patch('django_playground.services.weather.Channel')
+    def test_miss_schedules_one_fetch(self, channel):
+        self.assertIsNone(weather_service.get_activity_weather(self.activity))
+        self.assertIsNone(weather_service.get_activity_weather(self.activity))
+
+        channel.assert_called_once_with('background-fetch-weather')
+
+    def test_fetch_is_cached_by_rounded_location_and_hour(self):
+        seconds = track_service.epoch_seconds(self.activity['trackPoints'][0]['time'])
+        with mock.patch.object(weather_service.http, 'get') as get:
+            get.return_value.status_code = 200
+            get.return_value.json.return_value = {'currently': {'summary': 'Clear'}}
+            weather_service.fetch(52.52, 13.405, seconds)
+            weather_service.fetch(52.5199, 13.4040, seconds + 60)
+
+        get.assert_called_once_with('{}/52.52,13.40,{}?units=auto'.format(
+            weather_service.config['api'], int(seconds // 3600) * 3600
+        ))
+        self.assertEqual(weather_service.get_activity_weather(self.activity), {'currently': {'summary': 'Clear'}})
+
+    def test_failed_fetch_is_not_cached(self):
+        seconds = track_service.epoch_seconds(self.activity['trackPoints'][0]['time'])
+        with mock.patch.object(weather_service.http, 'get') as get:
+            get.return_value.status_code = 200
+            get.return_value.json.return_value = {'code': 400, 'error': 'The given location is invalid.'}
+            self.assertIsNone(weather_service.fetch(52.52, 13.405, seconds))
+            get.return_value.status_code = 503
+            get.return_value.json.side_effect = ValueError('No JSON object could be decoded')
+            self.assertIsNone(weather_service.fetch(52.52, 13.405, seconds))
+
+        self.assertEqual(get.call_count, 2)
+        self.assertIsNone(cache.get(weather_service.cache_key(52.52, 13.405, seconds)))
+
+
+class TestImportWindows(TestCase):
+
+    def test_import_windows_cover_range(self):
+        with mock.patch.dict(moves_service.config, import_window_days=7):
+            windows = list(moves_service.import_windows(date(2018, 1, 1), date(2018, 1, 16)))
+
+        self.assertEqual(windows, [
+            (date(2018, 1, 1), date(2018, 1, 7)),
+            (date(2018, 1, 8), date(2018, 1, 14)),
+            (date(2018, 1, 15), date(2018, 1, 16)),
+        ])
+
+    def test_import_windows_respect_api_maximum(self):
+        with mock.patch.dict(moves_service.config, import_window_days=31):
+            windows = list(moves_service.import_windows(date(2018, 1, 1), date(2018, 1, 10)))
+
+        self.assertEqual(windows[0], (date(2018, 1, 1), date(2018, 1, 7)))
+
+
+class TestRateLimiter(TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.limiter = RateLimiter([(2, 60), (3, 3600)], clock=lambda: self.now)
+
+    def test_limits_burst_to_capacity(self):
+        self.assertEqual(self.limiter.try_acquire(), 0)
+        self.assertEqual(self.limiter.try_acquire(), 0)
+        self.assertAlmostEqual(self.limiter.try_acquire(), 30)
+
+    def test_strictest_limit_wins(self):
+        self.limiter.try_acquire()
+        self.limiter.try_acquire()
+        self.now = 60.0
+        self.assertEqual(self.limiter.try_acquire(), 0)
+        # minute bucket refilled, hour bucket is empty
+        self.assertAlmostEqual(self.limiter.try_acquire(), 1200 - 60)
+
+
+class TestConcurrentImport(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user()
+        self.moves_profile = self.user.data_profiles.create(
+            provider=moves_service.name,
+            auth_data={'access_token': 'token', 'refresh_token': 'refresh'},
+            data={'profile': {'firstDate': '20180101'}}
+        )
+
+    def test_import_storyline_windows_against_stub(self):
+        windows = list(moves_service.import_windows(date(2018, 1, 1), date(2018, 1, 31)))
+        with MovesStubServer(delay=0.05) as stub:
+            with mock.patch.dict(moves_service.config, api=stub.url, import_workers=3, import_window_days=7):
+                self.assertTrue(moves_service.import_storyline_windows(self.moves_profile, windows))
+
+        self.assertEqual(len(stub.requests), len(windows))
+        self.assertEqual(self.moves_profile.data_points.count(), 31)
+        self.assertEqual(self.moves_profile.daily_summaries.count(), 31)
+        self.assertEqual(self.moves_profile.data_points.latest_date(), date(2018, 1, 31))
+
+
+class TestImportJobs(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user()
+        self.first_date = date.today() - timedelta(days=9)
+        self.moves_profile = self.user.data_profiles.create(
+            provider=moves_service.name,
+            auth_data={'access_token': 'token', 'refresh_token': 'refresh'},
+            data={'profile': {'firstDate': self.first_date.strftime('%Y%m%d')}}
+        )
+
+    def run_job(self, job):
+        with MovesStubServer() as stub:
+            with mock.patch.dict(moves_service.config, api=stub.url, import_window_days=7):
+                claimed = moves_service.run_import_job(job.id)
+        job.refresh_from_db()
+        return claimed, stub
+
+    def test_waiting_import_keeps_its_heartbeat(self):
+        job = self.moves_profile.import_jobs.create(state=ImportJob.RUNNING)
+        ImportJob.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        future = Future()
+        # a fetch sleeping in the rate limiter
+        threading.Timer(0.3, future.set_result, [['window']]).start()
+
+        with mock.patch.dict(moves_service.config, import_heartbeat_interval=0.1):
+            self.assertEqual(moves_service.wait_for_window(future, job), ['window'])
+
+        job.refresh_from_db()
+        self.assertGreater(job.updated_at, timezone.now() - timedelta(minutes=1))
+        self.assertFalse(moves_service.start_import(self.user)[1])
+
+    def test_start_import_is_deduplicated(self):
+        job, queued = moves_service.start_import(self.user)
+        same_job, queued_again = moves_service.start_import(self.user)
+
+        self.assertTrue(queued)
+        self.assertFalse(queued_again)
+        self.assertEqual(job, same_job)
+
+    def test_run_import_job(self):
+        job, queued = moves_service.start_import(self.user)
+        claimed, stub = self.run_job(job)
+
+        self.assertTrue(claimed)
+        self.assertEqual(job.state, ImportJob.DONE)
+        self.assertEqual((job.days_done, job.days_total), (10, 10))
+        self.assertEqual(job.cursor, date.today())
+        # a duplicate message for the same job does nothing
+        self.assertFalse(self.run_job(job)[0])
+
+    def test_resume_after_cursor(self):
+        job = self.moves_profile.import_jobs.create(
+            state=ImportJob.QUEUED, from_date=self.first_date, to_date=date.today(), days_total=10,
+            cursor=self.first_date + timedelta(days=6)
+        )
+        claimed, stub = self.run_job(job)
+
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual(stub.requests[0][1]['from'], (self.first_date + timedelta(days=7)).strftime('%Y%m%d'))
+        self.assertEqual(job.state, ImportJob.DONE)
+
+    @mock.patch('django_playground.services.moves.Group')
+    def test_progress_events_are_throttled(self, group):
+        job, queued = moves_service.start_import(self.user)
+
+        self.assertTrue(moves_service.publish_import_progress(job))
+        self.assertFalse(moves_service.publish_import_progress(job))
+        self.assertTrue(moves_service.publish_import_progress(job, force=True))
+
+        group.assert_called_with('imports-{}'.format(self.user.id))
+        self.assertEqual(group.return_value.send.call_count, 2)
+        event = json.loads(group.return_value.send.call_args[0][0]['text'])
+        self.assertEqual((event['type'], event['state']), ('import', ImportJob.QUEUED))
+
+    def test_current_progress_of_latest_job(self):
+        self.assertIsNone(moves_service.get_import_job(self.make_user('other')))
+        job, queued = moves_service.start_import(self.user)
+        job.days_total, job.days_done = 10, 5
+        job.save()
+
+        latest = moves_service.get_import_job(self.user)
+        event = json.loads(moves_service.import_progress_message(latest)['text'])
+        self.assertEqual((event['state'], event['progress']), (ImportJob.QUEUED, 50))
+
+    def test_cancelled_job_is_not_run(self):
+        job, queued = moves_service.start_import(self.user)
+        moves_service.cancel_import(self.user)
+        claimed, stub = self.run_job(job)
+
+        self.assertFalse(claimed)
+        self.assertEqual(job.state, ImportJob.CANCELLED)
+        self.assertEqual(stub.requests, [])
+
+
+class TestRequestRetries(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user()
+        self.moves_profile = self.user.data_profiles.create(
+            provider=moves_service.name,
+            auth_data={'access_token': 'token', 'refresh_token': 'refresh'}
+        )
+
+    def get_storyline(self, stub):
+        with mock.patch.dict(moves_service.config, api=stub.url, max_attempts=3):
+            return moves_service.get_data('storyline', self.moves_profile, date=date(2018, 1, 1))
+
+    @mock.patch('django_playground.services.moves.time.sleep')
+    def test_retries_transient_errors(self, sleep):
+        with MovesStubServer() as stub:
+            stub.fail(503, headers={'Retry-After': '2'})
+            storyline = self.get_storyline(stub)
+
+        self.assertEqual(storyline[0]['date'], '20180101')
+        self.assertEqual(len(stub.requests), 2)
+        sleep.assert_called_once_with(2.0)
+
+    @mock.patch('django_playground.services.moves.time.sleep')
+    def test_gives_up_after_max_attempts(self, sleep):
+        with MovesStubServer() as stub:
+            stub.fail(500, times=5)
+            with self.assertRaises(MovesApiError):
+                self.get_storyline(stub)
+
+        self.assertEqual(len(stub.requests), 3)
+
+    @mock.patch('django_playground.services.moves.time.sleep')
+    def test_does_not_retry_client_errors(self, sleep):
+        with MovesStubServer() as stub:
+            stub.fail(404)
+            with self.assertRaises(MovesApiError):
+                self.get_storyline(stub)
+
+        self.assertEqual(len(stub.requests), 1)
+        sleep.assert_not_called()
+
+
+class TestHttpClient(TestCase):
+
+    def test_pool_size(self):
+        with self.settings(HTTP_CLIENT={'pool_size': 3}):
+            client = HttpClient()
+        self.assertEqual(client.pool_size, 3)
+        self.assertEqual(client.adapter._pool_maxsize, 3)
+        self.assertEqual(HttpClient(pool_size=7).pool_size, 7)
+
+    def test_keep_alive_connection_is_reused(self):
+        client = HttpClient(pool_size=1)
+        with MovesStubServer() as stub:
+            for i in range(3):
+                self.assertEqual(client.get(stub.url + '/user/profile').json()['userId'], 1)
+
+        self.assertEqual(len(stub.requests), 3)
+        self.assertEqual(len(stub.connections), 1)
+
+    def test_threads_have_own_sessions_sharing_the_pool(self):
+        client = HttpClient()
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(client.session))
+        thread.start()
+        thread.join()
+
+        self.assertIs(client.session, client.session)
+        self.assertIsNot(sessions[0], client.session)
+        self.assertIs(sessions[0].get_adapter('https://api.moves-app.com'), client.adapter)
+
+
+class TestTokenValidation(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.make_user()
+        self.moves_profile = self.user.data_profiles.create(
+            provider=moves_service.name,
+            auth_data={'access_token': 'token', 'refresh_token': 'refresh', 'expires_at': time.time() + 30 * 86400}
+        )
+
+    @mock.patch('django_playground.services.moves.Channel')
+    def test_valid_token_skips_tokeninfo(self, channel):
+        with mock.patch.object(moves_service, 'get_token_info') as token_info:
+            moves_service.validate_authentication(self.user)
+            moves_service.validate_authentication(self.user)
+
+        token_info.assert_not_called()
+        channel.assert_not_called()
+
+    @mock.patch('django_playground.services.moves.Channel')
+    def test_expiring_token_is_refreshed_in_background(self, channel):
+        self.moves_profile.auth_data['expires_at'] = time.time() + 3600
+        self.moves_profile.save()
+
+        moves_service.validate_authentication(self.user)
+        moves_service.validate_authentication(self.user)
+
+        channel.assert_called_once_with('background-refresh-token')
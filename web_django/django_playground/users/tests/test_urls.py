@@ -49,3 +49,23 @@ class TestUserURLs(TestCase):
             resolve('/users/~update/').view_name,
             'users:update'
         )
+
+    def test_chart_detail_reverse(self):
+        """users:chart_detail should reverse next to the mpl_detail.svg of an activity."""
+        self.assertEqual(
+            reverse('users:chart_detail', kwargs={'date': '2018-01-20', 'index': 1}),
+            '/users/detail/2018-01-20/1/chart_detail.json'
+        )
+
+    def test_chart_pie_resolve(self):
+        """/users/chart_pie.json/10/ should resolve to users:chart_pie_day."""
+        self.assertEqual(resolve('/users/chart_pie.json/10/').view_name, 'users:chart_pie_day')
+
+    def test_rollups_reverse(self):
+        """users:rollups_year should reverse to the json overview of a year."""
+        self.assertEqual(reverse('users:rollups_year', kwargs={'year': 2018}), '/users/rollups/2018.json')
+
+    def test_rollups_resolve(self):
+        """/users/rollups/week.json should resolve to users:rollups, /users/moves-data/2018/ to users:year."""
+        self.assertEqual(resolve('/users/rollups/week.json').view_name, 'users:rollups')
+        self.assertEqual(resolve('/users/moves-data/2018/').view_name, 'users:year')
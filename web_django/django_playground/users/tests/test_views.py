@@ -1,11 +1,20 @@
+import gzip
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
 from django.test import RequestFactory
+from django.utils.http import http_date
 
 from test_plus.test import TestCase
 
+from ...services import chart_service, moves_service
 from ..views import (
     UserRedirectView,
     UserUpdateView
 )
+from .test_services import make_storyline_day
 
 
 class BaseUserTestCase(TestCase):
@@ -62,3 +71,275 @@ class TestUserUpdateView(BaseUserTestCase):
             self.view.get_object(),
             self.user
         )
+
+
+class BaseActivityViewTestCase(BaseUserTestCase):
+    """A logged in user with one imported day, 2018-01-20."""
+
+    def setUp(self):
+        super(BaseActivityViewTestCase, self).setUp()
+        cache.clear()
+        # loaded days are memoized in the process, across tests
+        moves_service.day_memo.clear()
+        self.moves_profile = self.user.data_profiles.create(
+            provider=moves_service.name, data={'profile': {'firstDate': '20180101'}}
+        )
+        moves_service.store_storyline(self.moves_profile, [make_storyline_day()])
+        self.client.force_login(self.user)
+
+
+class TestUserActivityGeoJsonView(BaseActivityViewTestCase):
+
+    def setUp(self):
+        super(TestUserActivityGeoJsonView, self).setUp()
+        self.url = reverse('users:geojson', kwargs={'date': '2018-01-20'})
+
+    def test_get_geojson(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        geojson = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(geojson['type'], 'FeatureCollection')
+        self.assertEqual(len(geojson['features']), 2)
+
+    def test_get_geojson_gzipped(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content).decode('utf-8')),
+                         json.loads(self.client.get(self.url).content.decode('utf-8')))
+
+    def test_revalidate_with_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        # another simplification is another document
+        response = self.client.get(self.url, {'tolerance': 50}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_revalidate_with_last_modified(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Last-Modified'], last_modified)
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_takes_precedence_over_last_modified(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"outdated"', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_requires_login(self):
+        self.client.logout()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+
+class TestChartCache(BaseActivityViewTestCase):
+
+    def setUp(self):
+        super(TestChartCache, self).setUp()
+        self.url = reverse('users:mpl_recent')
+
+    def test_get_chart(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', response.content)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_revalidate_with_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_chart_is_rendered_once(self):
+        content = self.client.get(self.url).content
+
+        with mock.patch.object(chart_service, 'render') as render:
+            response = self.client.get(self.url)
+        self.assertFalse(render.called)
+        self.assertEqual(response.content, content)
+
+    def test_import_invalidates_chart(self):
+        etag = self.client.get(self.url)['ETag']
+        moves_service.touch_imported_at(self.moves_profile)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class TestChartJsonViews(BaseActivityViewTestCase):
+
+    def get_json(self, url, **extra):
+        response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_chart_recent(self):
+        data = self.get_json(reverse('users:chart_recent'))
+
+        cycling = next(series for series in data['activities'] if series['activity'] == 'cycling')
+        self.assertEqual(cycling['dates'], ['20180120'])
+        self.assertEqual(cycling['distances'], [1500.0])
+
+    def test_chart_pie(self):
+        data = self.get_json(reverse('users:chart_pie_date', kwargs={'datepie': '2018-01-20'}))
+
+        distances = dict((element['activity'], element['distance']) for element in data['activities'])
+        self.assertEqual(distances['cycling'], 1500.0)
+
+    def test_chart_detail_is_downsampled(self):
+        url = reverse('users:chart_detail', kwargs={'date': '2018-01-20', 'index': 0})
+        data = self.get_json(url)
+        self.assertEqual(data['activity'], 'cycling')
+        self.assertEqual(len(data['distances']), len(data['speeds']))
+        self.assertGreater(len(data['distances']), 0)
+
+        for points, expected in (('3', 3), ('100000', 500), ('all', 500)):
+            # the default of 500 points is already cached
+            cache.clear()
+            with mock.patch.object(chart_service, 'downsample', wraps=chart_service.downsample) as downsample:
+                self.get_json(url, data={'points': points})
+            self.assertEqual(downsample.call_args[0][2], expected)
+
+    def test_revalidate_with_etag(self):
+        url = reverse('users:chart_detail', kwargs={'date': '2018-01-20', 'index': 0})
+        etag = self.client.get(url)['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # the json is cached apart from the svg chart of the same data
+        response = self.client.get(reverse('users:mpl_detail', kwargs={'date': '2018-01-20', 'index': 0}),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # and per number of points
+        self.assertEqual(self.client.get(url, {'points': 2}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class TestUserActivityGeoJsonExportView(BaseActivityViewTestCase):
+
+    def get_geojson(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        return json.loads(b''.join(response.streaming_content).decode('utf-8'))
+
+    def test_export_month(self):
+        response = self.client.get(reverse('users:geojson_month', kwargs={'month': '2018-01'}))
+
+        geojson = self.get_geojson(response)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="moves-2018-01.geojson"')
+        self.assertEqual([f['geometry']['type'] for f in geojson['features']], ['Point', 'LineString'])
+
+    def test_export_range(self):
+        url = reverse('users:geojson_range', kwargs={'from_date': '2018-01-21', 'to_date': '2018-01-31'})
+        response = self.client.get(url)
+
+        geojson = self.get_geojson(response)
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="moves-2018-01-21_2018-01-31.geojson"')
+        self.assertEqual(geojson, {'type': 'FeatureCollection', 'features': []})
+
+    def test_export_invalid_range(self):
+        for from_date, to_date in (('2018-01-21', '2018-01-20'), ('2017-01-01', '2018-01-20')):
+            url = reverse('users:geojson_range', kwargs={'from_date': from_date, 'to_date': to_date})
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class TestUserActivityTileView(BaseActivityViewTestCase):
+
+    def tile_url(self, z, x, y):
+        return reverse('users:tile', kwargs={'z': z, 'x': x, 'y': y})
+
+    def test_get_tile(self):
+        # zoom 12 tile of Berlin Mitte, the track starts in it
+        response = self.client.get(self.tile_url(12, 2200, 1343))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertIn(b'cycling', response.content)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response = self.client.get(self.tile_url(12, 2200, 1343), {'from': '20180121'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+
+    def test_revalidate_with_etag(self):
+        etag = self.client.get(self.tile_url(12, 2200, 1343))['ETag']
+
+        response = self.client.get(self.tile_url(12, 2200, 1343), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(self.tile_url(12, 2200, 1344), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_tile(self):
+        self.assertEqual(self.client.get(self.tile_url(12, 4096, 0)).status_code, 404)
+        self.assertEqual(self.client.get(self.tile_url(99, 0, 0)).status_code, 404)
+
+
+class TestRollupViews(BaseActivityViewTestCase):
+
+    def get_json(self, url, data=None):
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_year_page(self):
+        response = self.client.get(reverse('users:year', kwargs={'year': '2018'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'pages/year.html')
+        self.assertEqual(response.context['year'], 2018)
+        self.assertEqual(response.context['years'], [2018])
+        self.assertEqual(len(response.context['months']), 1)
+        self.assertEqual(len(response.context['weeks']), 1)
+
+    def test_year_json(self):
+        data = self.get_json(reverse('users:rollups_year', kwargs={'year': '2018'}))
+
+        self.assertEqual(data['year'], 2018)
+        self.assertEqual(data['totals']['cycling']['distance'], 1500.0)
+        self.assertEqual([month['start'] for month in data['months']], ['2018-01-01'])
+        self.assertEqual([week['start'] for week in data['weeks']], ['2018-01-15'])
+        self.assertEqual(data['weeks'][0]['totals']['cycling']['count'], 1)
+
+        data = self.get_json(reverse('users:rollups_year', kwargs={'year': '2017'}))
+        self.assertEqual((data['months'], data['weeks']), ([], []))
+
+    def test_rollups(self):
+        data = self.get_json(reverse('users:rollups', kwargs={'period': 'month'}))
+
+        self.assertEqual(data['period'], 'month')
+        self.assertEqual([(r['activity'], r['start'], r['distance']) for r in data['rollups']],
+                         [('cycling', '2018-01-01', 1500.0)])
+
+        data = self.get_json(reverse('users:rollups', kwargs={'period': 'week'}), {'from': '20180116'})
+        self.assertEqual(data['rollups'], [])
+        data = self.get_json(reverse('users:rollups', kwargs={'period': 'week'}), {'to': '20180115'})
+        self.assertEqual([r['start'] for r in data['rollups']], ['2018-01-15'])
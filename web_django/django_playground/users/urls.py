@@ -4,6 +4,8 @@ from .channels.consumers import ws_connect
 from .channels.consumers import ws_disconnect
 from .channels.consumers import hello
 from .channels.consumers import import_data
+from .channels.consumers import refresh_token
+from .channels.consumers import fetch_weather
 
 from . import views
 
@@ -38,6 +40,11 @@ urlpatterns = [
         view=views.UserMovesImportView.as_view(),
         name='moves_import'
     ),
+    url(
+        regex=r'^~moves/import/cancel$',
+        view=views.UserMovesImportCancelView.as_view(),
+        name='moves_import_cancel'
+    ),
     url(
         regex=r'^moves-data$',
         view=views.UserActivityListView.as_view(),
@@ -48,6 +55,11 @@ urlpatterns = [
         view=views.UserActivityMonthView.as_view(),
         name='month'
     ),
+    url(
+        regex=r'^moves-data/(?P<year>\d{4})/$',
+        view=views.UserActivityYearView.as_view(),
+        name='year'
+    ),
     url(
         regex=r'^detail/(?P<date>\d{4}-\d{2}-\d{2})/(?P<index>\d+)/$',
         view=views.UserActivityDetailView.as_view(),
@@ -57,19 +69,43 @@ urlpatterns = [
         regex=r'^detail/(?P<date>\d{4}-\d{2}-\d{2})/(?P<index>\d+)/mpl_detail.svg',
         view=views.UserActivityMplDetailView.as_view(), name='mpl_detail'
     ),
+    url(
+        regex=r'^detail/(?P<date>\d{4}-\d{2}-\d{2})/(?P<index>\d+)/chart_detail.json$',
+        view=views.UserActivityDetailChartView.as_view(), name='chart_detail'
+    ),
     url(
         regex=r'^detail/(?P<date>\d{4}-\d{2}-\d{2})/(?P<index>\d+)/geojson$',
         view=views.UserActivityDetailMapView.as_view(), name='detail_map_geojson'
     ),
     url(regex=r'^map/(?P<date>\d{4}-\d{2}-\d{2})/$', view=views.UserActivityMapView.as_view(), name='map'),
     url(regex=r'^geojson/(?P<date>\d{4}-\d{2}-\d{2})/$', view=views.UserActivityGeoJsonView.as_view(), name='geojson'),
+    url(regex=r'^geojson/(?P<month>\d{4}-\d{2})/$', view=views.UserActivityGeoJsonExportView.as_view(),
+        name='geojson_month'),
+    url(regex=r'^geojson/(?P<from_date>\d{4}-\d{2}-\d{2})/(?P<to_date>\d{4}-\d{2}-\d{2})/$',
+        view=views.UserActivityGeoJsonExportView.as_view(), name='geojson_range'),
+    url(regex=r'^rollups/(?P<year>\d{4})\.json$', view=views.UserActivityYearJsonView.as_view(), name='rollups_year'),
+    url(regex=r'^rollups/(?P<period>week|month|year)\.json$', view=views.UserActivityRollupView.as_view(),
+        name='rollups'),
+    url(regex=r'^tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.mvt$', view=views.UserActivityTileView.as_view(), name='tile'),
     url(regex=r'^mpl_recent.svg/(?P<date>\d{4}\d{2})/$', view=views.UserActivityMplView.as_view(), name='mplimage'),
     url(regex=r'^mpl_recent.svg$', view=views.UserActivityMplView.as_view(), name='mpl_recent'),
     url(regex=r'^mpl_pie.svg/(?P<dayspie>\d{2})/$', view=views.UserActivityMplPieView.as_view(), name='mpl_pie_day'),
-    url(regex=r'^mpl_pie.svg/(?P<datepie>\d{4}-\d{2}-\d{2})/$', view=views.UserActivityMplPieView.as_view(), name='mpl_pie_date'),
+    url(regex=r'^mpl_pie.svg/(?P<datepie>\d{4}-\d{2}-\d{2})/$', view=views.UserActivityMplPieView.as_view(),
+        name='mpl_pie_date'),
+    url(regex=r'^chart_recent.json/(?P<date>\d{4}\d{2})/$', view=views.UserActivityChartView.as_view(),
+        name='chart_month'),
+    url(regex=r'^chart_recent.json$', view=views.UserActivityChartView.as_view(), name='chart_recent'),
+    url(regex=r'^chart_pie.json/(?P<dayspie>\d{2})/$', view=views.UserActivityPieChartView.as_view(),
+        name='chart_pie_day'),
+    url(regex=r'^chart_pie.json/(?P<datepie>\d{4}-\d{2}-\d{2})/$', view=views.UserActivityPieChartView.as_view(),
+        name='chart_pie_date'),
 
 ]
 
 channel_routing = [
+    route('websocket.connect', ws_connect),
+    route('websocket.disconnect', ws_disconnect),
     route('background-import-data', import_data),
+    route('background-refresh-token', refresh_token),
+    route('background-fetch-weather', fetch_weather),
 ]
@@ -3,28 +3,93 @@ from django.shortcuts import redirect, render
 from django.views import View
 from django.views.generic.detail import SingleObjectMixin
 from django.views.generic import DetailView, ListView, RedirectView, UpdateView
-from django.http import JsonResponse, HttpResponse, HttpResponseRedirect
+from django.http import (
+    Http404, JsonResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+)
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 from django.views.decorators.cache import never_cache
 
 from .models import User
+from ..services import chart_service
 from ..services import moves_service
+from ..services import tile_service
 from ..services import utils_service
 
+from calendar import monthrange
+import gzip
+import hashlib
 import logging
-from channels import Channel
 import json
 
-import matplotlib
-matplotlib.use('Agg')
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-import matplotlib.pyplot as plt
-import numpy as np
-
 logger = logging.getLogger(__name__)
 
 
+class ChartCacheMixin(object):
+    """Serve rendered charts and chart data from the cache, with ETag revalidation.
+
+    The cache key covers everything a chart depends on: user, chart type, url
+    parameters, the last import of the user's data and the chart/metrics code
+    versions. A new import therefore invalidates all charts of the user.
+    """
+    chart_version = 2
+    chart_cache_timeout = 60 * 60 * 24 * 7
+
+    def chart_cache_key(self, user, chart, params):
+        moves_profile = user.data_profiles.get(provider=moves_service.name)
+        imported_at = moves_profile.imported_at.isoformat() if moves_profile.imported_at else ''
+        parts = [user.id, chart, self.chart_version, moves_service.tracks.version, imported_at] + list(params)
+        return 'chart:{}'.format(hashlib.sha1(repr(parts).encode('utf-8')).hexdigest())
+
+    def cached_chart(self, request, user, chart, params, render, content_type):
+        key = self.chart_cache_key(user, chart, params)
+        etag = '"{}"'.format(key.split(':')[1])
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+        else:
+            content = cache.get(key)
+            if content is None:
+                content = render()
+                cache.set(key, content, self.chart_cache_timeout)
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        # the browser keeps the chart but has to revalidate it, which is a cheap 304
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def cached_svg(self, request, user, chart, params, render):
+        return self.cached_chart(request, user, chart, params, render, 'image/svg+xml')
+
+    def cached_json(self, request, user, chart, params, data):
+        """Like cached_svg, `data` returns the chart data which is cached serialized."""
+        return self.cached_chart(request, user, chart, params,
+                                 lambda: json.dumps(data(), separators=(',', ':')).encode('utf-8'),
+                                 'application/json')
+
+
+class SimplifyMixin(object):
+    """Read the optional track simplification of GeoJSON views from the query string.
+
+    ?tolerance= is the allowed deviation in meters, ?zoom= the map zoom level the
+    tracks are drawn at (deviation of one pixel).
+    """
+    max_zoom = 22
+
+    def simplify_params(self, request):
+        params = {}
+        try:
+            if 'tolerance' in request.GET:
+                params['tolerance'] = max(float(request.GET['tolerance']), 0)
+            if 'zoom' in request.GET:
+                params['zoom'] = min(max(int(request.GET['zoom']), 0), self.max_zoom)
+        except ValueError:
+            pass
+        return params
+
+
 class UserDetailView(LoginRequiredMixin, DetailView):
     model = User
     # These next two lines tell the view to index lookups by username
@@ -44,6 +109,8 @@ class UserDetailView(LoginRequiredMixin, DetailView):
         context['moves_connected'] = user_is_authenticated
         context['moves_auth_url'] = moves_service.get_auth_url()
         context['moves_data_available'] = moves_service.moves_data_available(user)
+        if user_is_authenticated:
+            context['import_job'] = moves_service.get_import_job(user)
 
         return context
 
@@ -93,11 +160,8 @@ class UserMovesImportView(LoginRequiredMixin, SingleObjectMixin, View):
         user = User.objects.get(username=request.user.username)
         if moves_service.is_user_authenticated(user):
             try:
-                # moves_service.import_storyline(user)
-                Channel('background-import-data').send(dict(
-                    provider='moves',
-                    user_id=user.id
-                ))
+                # runs in the background-import-data worker, a running import is not started twice
+                moves_service.start_import(user)
                 return redirect('users:detail', username=user.username)
             except Exception as e:
                 return HttpResponse(e.msg, 400)
@@ -105,6 +169,13 @@ class UserMovesImportView(LoginRequiredMixin, SingleObjectMixin, View):
             return HttpResponse('Moves Not Authenticated', 400)
 
 
+class UserMovesImportCancelView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        user = User.objects.get(username=request.user.username)
+        moves_service.cancel_import(user)
+        return redirect('users:detail', username=user.username)
+
+
 class UserListView(LoginRequiredMixin, ListView):
     model = User
     # These next two lines tell the view to index lookups by username
@@ -130,9 +201,11 @@ class UserActivityListView(LoginRequiredMixin, View):
             'user': user,
             # 'profile': json.dumps(moves_profile.data, indent=2),
             'profile': moves_profile.data,
+            'totals': moves_service.get_totals(moves_profile),
             'summary': summary,
             'days': using_for,
-            'months': months
+            'months': months,
+            'years': moves_service.get_rollup_years(moves_profile)
         })
 
 
@@ -163,16 +236,69 @@ class UserActivityMonthView(LoginRequiredMixin, View):
             'summary': summary,
             'months': months,
             'date' : date,
+            'export_month': '{}-{}'.format(date[:4], date[4:6]),
             'sel_month': selMonth,
             'sel_year' : selYear
         })
 
 
+class UserActivityYearView(LoginRequiredMixin, View):
+    """return the rendered year overview, read from the precomputed totals"""
+    def get(self, request, year, *args, **kwargs):
+        user = User.objects.get(username=request.user.username)
+        moves_profile = user.data_profiles.get(provider=moves_service.name)
+        overview = moves_service.get_year_overview(moves_profile, int(year))
+        activities = moves_service.totals_activities
+
+        # one table row per period, one cell per activity
+        rows = dict()
+        for period in ('months', 'weeks'):
+            rows[period] = [dict(
+                dateObj=utils_service.make_date_from(row['start']),
+                totals=[row['totals'].get(activity) for activity in activities]
+            ) for row in overview[period]]
+
+        return render(request, 'pages/year.html', {
+            'user': user,
+            'year': overview['year'],
+            'totals': [overview['totals'][activity] for activity in activities],
+            'months': rows['months'],
+            'weeks': rows['weeks'],
+            'years': moves_service.get_rollup_years(moves_profile),
+            'activities': activities
+        })
+
+
+class UserActivityYearJsonView(LoginRequiredMixin, View):
+    """returns the totals of a year with its months and weeks as json"""
+    def get(self, request, year, *args, **kwargs):
+        user = User.objects.get(username=request.user.username)
+        moves_profile = user.data_profiles.get(provider=moves_service.name)
+        return JsonResponse(moves_service.get_year_overview(moves_profile, int(year)))
+
+
+class UserActivityRollupView(LoginRequiredMixin, View):
+    """returns the totals per week, month or year and activity as json, optionally for ?from= and ?to= dates"""
+    def get(self, request, period, *args, **kwargs):
+        dates = []
+        for param in ('from', 'to'):
+            value = request.GET.get(param)
+            if value:
+                utils_service.validate_date(value)
+                value = utils_service.make_date_from(value)
+            dates.append(value or None)
+
+        user = User.objects.get(username=request.user.username)
+        moves_profile = user.data_profiles.get(provider=moves_service.name)
+        return JsonResponse(dict(period=period, rollups=moves_service.get_rollups(moves_profile, period, *dates)))
+
+
 class UserActivityDetailView(LoginRequiredMixin, View):
     def get(self, request, date, index, *args, **kwargs):
         user = User.objects.get(username=request.user.username)
         api_date = date.replace('-', '')
-        activity = moves_service.get_activity_date(user, utils_service.make_date_from(api_date), int(index))
+        activity = moves_service.get_activity_date(user, utils_service.make_date_from(api_date), int(index),
+                                                   weather=True)
 
         return render(request, 'pages/detail.html', {
             'user': user,
@@ -186,7 +312,7 @@ class UserActivityMapView(LoginRequiredMixin, View):
         api_date = date.replace('-', '')
         view_date = utils_service.make_date_from(api_date)
         user = User.objects.get(username=request.user.username)
-        activities = moves_service.get_activities_date(user, utils_service.make_date_from(api_date))
+        activities = moves_service.get_activities_date(user, utils_service.make_date_from(api_date), track_points=False)
 
         return render(request, 'pages/map.html', {
             'date': date,
@@ -195,264 +321,181 @@ class UserActivityMapView(LoginRequiredMixin, View):
         })
 
 
-class UserActivityGeoJsonView(LoginRequiredMixin, View):
+class UserActivityGeoJsonView(LoginRequiredMixin, SimplifyMixin, View):
     def get(self, request, date, *args, **kwargs):
         """returns a json for mapview is called via ajax in map template"""
         api_date = date.replace('-', '')
         utils_service.validate_date(api_date)
 
         user = User.objects.get(username=request.user.username)
-        info = moves_service.get_storyline_date(user, utils_service.make_date_from(api_date))
+        day = utils_service.make_date_from(api_date)
+        moves_profile = user.data_profiles.get(provider=moves_service.name)
+
+        simplify = self.simplify_params(request)
+        key = moves_service.day_geojson_key(moves_profile, day, simplify)
+        etag = '"{}"'.format(key.split(':')[1])
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+        else:
+            geojson = moves_service.get_day_geojson(moves_profile, day, simplify, key)
+            modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+            if 'HTTP_IF_NONE_MATCH' not in request.META and modified_since and modified_since >= geojson['modified']:
+                response = HttpResponseNotModified()
+            elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+                response = HttpResponse(geojson['body'], content_type='application/geo+json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(gzip.decompress(geojson['body']), content_type='application/geo+json')
+            response['Last-Modified'] = http_date(geojson['modified'])
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept-Encoding'])
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
-        features = []
-        for segment in info[0]['segments']:
-            if segment['type'] == 'place':
-                features.append(utils_service.geojson_place(segment))
-            elif segment['type'] == 'move':
-                features.extend(utils_service.geojson_move(segment))
 
-        geojson = {'type': 'FeatureCollection', 'features': features}
-        filename = "moves-%s.geojson" % date
-        return HttpResponse(json.dumps(geojson),  content_type='application/geo+json')
+class UserActivityGeoJsonExportView(LoginRequiredMixin, SimplifyMixin, View):
+    """streams the tracks of a month or a date range as geojson download"""
+    max_days = 366
 
+    def get(self, request, month=None, from_date=None, to_date=None, *args, **kwargs):
+        if month is not None:
+            from_date = utils_service.make_date_from(month)
+            to_date = from_date.replace(day=monthrange(from_date.year, from_date.month)[1])
+            name = month
+        else:
+            utils_service.validate_date(from_date)
+            utils_service.validate_date(to_date)
+            name = '{}_{}'.format(from_date, to_date)
+            from_date = utils_service.make_date_from(from_date)
+            to_date = utils_service.make_date_from(to_date)
+        if to_date < from_date or (to_date - from_date).days >= self.max_days:
+            raise Http404('Export range has to cover 1 to {} days'.format(self.max_days))
 
-class UserActivityMplView(LoginRequiredMixin, View):
-    @never_cache
-    def get(self, request, date=None, *args, **kwargs):
-        """returns a matplot activity image"""
+        user = User.objects.get(username=request.user.username)
+        moves_profile = user.data_profiles.get(provider=moves_service.name)
+
+        segments = moves_service.iter_segments(moves_profile, from_date, to_date)
+        features = utils_service.geojson_features(segments, **self.simplify_params(request))
+        response = StreamingHttpResponse(utils_service.geojson_stream(features), content_type='application/geo+json')
+        response['Content-Disposition'] = 'attachment; filename="moves-{}.geojson"'.format(name)
+        return response
+
+
+class UserActivityTileView(LoginRequiredMixin, ChartCacheMixin, View):
+    """returns a mapbox vector tile of the user's tracks, optionally for ?from= and ?to= dates"""
+    def get(self, request, z, x, y, *args, **kwargs):
+        z, x, y = int(z), int(x), int(y)
+        if not tile_service.is_valid(z, x, y):
+            raise Http404('No such tile')
+        dates = []
+        for param in ('from', 'to'):
+            value = request.GET.get(param)
+            if value:
+                utils_service.validate_date(value)
+                value = utils_service.make_date_from(value)
+            dates.append(value or None)
 
-        # init figure & canvas
-        plt.close()
-        fig = plt.figure()
-        fig.patch.set_alpha(0)
-        canvas = FigureCanvas(fig)
+        user = User.objects.get(username=request.user.username)
+        moves_profile = user.data_profiles.get(provider=moves_service.name)
+        return self.cached_chart(request, user, 'tile', [z, x, y] + dates,
+                                 lambda: tile_service.render(moves_profile, z, x, y, *dates),
+                                 'application/vnd.mapbox-vector-tile')
 
-        # color map for coloring diagram-stuff
-        # ref: https://matplotlib.org/examples/color/colormaps_reference.html
-        #color_list = plt.cm.tab10(np.linspace(0, 1, 24))
 
+class UserActivityMplView(LoginRequiredMixin, ChartCacheMixin, View):
+    def get(self, request, date=None, *args, **kwargs):
+        """returns a matplot activity image"""
         user = User.objects.get(username=request.user.username)
+        return self.cached_svg(request, user, 'recent', [date], lambda: self.render_svg(user, date))
+
+    def get_series(self, user, date):
         if date is not None:
             adjust_date = utils_service.make_date_from(date)
             summary = moves_service.get_summary_month(user, adjust_date)
         else:
             summary = moves_service.get_summary_past_days(user, 30)
 
-        activities = { 1: 'walking', 2: 'running', 3: 'cycling' }
-        #print(summary)
-        for act in activities:
-            x = []
-            y = []
-            dailydist = {}
-            dailydist.clear()
-            activity = activities[act]
-
-            for day in summary:
-
-                if not day['summary']:
-                    dailydist[day['date']] = 0
-                    continue
-                for element in day['summary']:
-                    if element['activity'] == activity:
-                        dailydist[day['date']] = element['distance']
-
-            if dailydist:
-                list = sorted(dailydist.items())
-                x, y = zip(*list)
-                x = [utils_service.make_date_from(key) for key in x]
-            else:
-                continue
+        return chart_service.recent_series(summary)
 
-            # do the plotting
-            if np.sum(y) > 0:
-                plt.plot(x, y, 'o-', color=utils_service.get_activity_color(activity), label=activity)
+    def render_svg(self, user, date):
+        return chart_service.render('recent', self.get_series(user, date))
 
 
-        # set plot title
-        plt.title("Recent Activities", color='white', fontweight='bold')
+class UserActivityChartView(UserActivityMplView):
+    """returns the data of the recent activity chart as json, one column per activity"""
+    def get(self, request, date=None, *args, **kwargs):
+        user = User.objects.get(username=request.user.username)
+        return self.cached_json(request, user, 'recent.json', [date],
+                                lambda: dict(activities=self.get_series(user, date)))
 
-        # set label for x-axis
-        plt.xlabel('Date', labelpad=10, color='white', fontweight='bold')
 
-        # set label for y-axis
-        plt.ylabel('Distances (m)', labelpad=10, color='white', fontweight='bold')
+class UserActivityMplDetailView(LoginRequiredMixin, ChartCacheMixin, View):
+    """returns a matplot activity-detail image"""
+    def get(self, request, date, index, *args, **kwargs):
+        user = User.objects.get(username=request.user.username)
+        return self.cached_svg(request, user, 'detail', [date, index], lambda: self.render_svg(user, date, index))
 
-        # settings for ticks on x-axis
-        plt.xticks(fontsize=10, rotation=33, color='white')
-        plt.yticks(fontsize=10, color='white')
+    def get_series(self, user, date, index):
+        api_date = date.replace('-', '')
+        activity = moves_service.get_activity_date(user, utils_service.make_date_from(api_date), int(index))
 
-        # misc settings
-        plt.tick_params('both', color='white')
-        plt.subplots_adjust(bottom=0.2, left=0.15)
-        plt.grid(True, 'major', 'both', ls='--', lw=.5, c='w', alpha=.25)
-        plt.box(False)
-        # enable legend
-        plt.legend()
+        return chart_service.speed_series(activity)
 
-        # prepare the response, setting Content-Type
-        response=HttpResponse(content_type='image/svg+xml')
-        # print the image on the response
-        canvas.print_figure(response, format='svg')
-        # and return it
-        return response
+    def render_svg(self, user, date, index):
+        return chart_service.render('speed', self.get_series(user, date, index))
 
 
-class UserActivityMplDetailView(LoginRequiredMixin, View):
-    """returns a matplot activity-detail image"""
-    @never_cache
+class UserActivityDetailChartView(UserActivityMplDetailView):
+    """returns speed over distance of an activity as json, downsampled to at most ?points= pairs"""
+    max_points = 500
+
     def get(self, request, date, index, *args, **kwargs):
         user = User.objects.get(username=request.user.username)
-        api_date = date.replace('-', '')
-        activity = moves_service.get_activity_date(user, utils_service.make_date_from(api_date), int(index))
+        try:
+            points = min(int(request.GET.get('points', self.max_points)), self.max_points)
+        except ValueError:
+            points = self.max_points
+        return self.cached_json(request, user, 'detail.json', [date, index, points],
+                                lambda: self.get_data(user, date, index, points))
 
-        # extracting useful data
-        currActivity = activity['activity']
-        #print(currActivity)
-        cutout = activity['trackPoints']
-
-        # color map for coloring diagram-stuff
-        # ref: https://matplotlib.org/examples/color/colormaps_reference.html
-        # color_list = plt.cm.tab10(np.linspace(0, 1, 24))
-
-        # define what is needed
-        speedist = {}
-        distance = 0.0
-        x = []
-        y = []
-
-        # extract data
-        for tp in cutout:
-            if tp.get('distance') is not None:
-                distance += tp.get('distance')
-                kmh = tp.get('speed_kmh')
-                speedist.update({distance:kmh})
-
-        if speedist:
-            list = sorted(speedist.items())
-            x, y = zip(*list)
-
-        # set figure dimension
-        figsize_w = 9
-        figsize_h = 2
-
-        # instantiate the figure
-        plt.close()
-        fig = plt.figure(figsize=(figsize_w, figsize_h), dpi=300)
-        fig.patch.set_alpha(0)
-        canvas = FigureCanvas(fig)
-
-        # create some space around axis labels
-        plt.subplots_adjust(bottom=0.3, left=0.15)
-
-        # configure plot grid
-        plt.grid(True, 'major', 'both', ls='--', lw=.5, c='w', alpha=.25)
-
-        # disable axis box
-        plt.box(False)
-
-        # set label for x-axis
-        plt.xlabel("Distance (m)", labelpad=10, color='w')
-
-        # set label for y-axis
-        plt.ylabel("Velocity (km/h)", labelpad=10, color='w')
-
-        # misc settings
-        plt.tick_params('both', color='w')
-        plt.xticks(color='w')
-        plt.yticks(color='w')
-
-        # create plot or name the shame (no sufficient data)
-        if len(x)>0 and len(y)>0:
-            plt.plot(x, y, '.-', color=utils_service.get_activity_color(currActivity))
-        else:
-            fig.text(.25, .5, 'Oops, not enough data for generating a plot :( ', style='normal',
-                    bbox={'facecolor': 'red', 'alpha': 0.5, 'pad': 10})
-
-        # prepare the response, setting Content-Type
-        response = HttpResponse(content_type='image/svg+xml')
-        # print the image on the response
-        canvas.print_figure(response, format='svg')
-        # and return it
-        return response
+    def get_data(self, user, date, index, points):
+        series = self.get_series(user, date, index)
+        series['distances'], series['speeds'] = chart_service.downsample(
+            series['distances'], series['speeds'], points
+        )
+        return series
 
 
-class UserActivityMplPieView(LoginRequiredMixin, View):
+class UserActivityMplPieView(LoginRequiredMixin, ChartCacheMixin, View):
 
     """returns a matplot pie chart image"""
-    @never_cache
     def get(self, request, datepie=None, dayspie=10, *args, **kwargs):
-        # init figure & canvas
-        fig = plt.figure(figsize=(3,4))
-        canvas = FigureCanvas(fig)
-
-        # color map for coloring diagram-stuff
-        # ref: https://matplotlib.org/examples/color/colormaps_reference.html
-        #color_list = plt.cm.tab10(np.linspace(0, 1, 24))
-
         user = User.objects.get(username=request.user.username)
+        return self.cached_svg(request, user, 'pie', [datepie, dayspie],
+                               lambda: self.render_svg(user, datepie, dayspie))
 
+    def get_distances(self, user, datepie, dayspie):
         if datepie is not None:
             api_date = datepie.replace('-', '')
-            summary = moves_service.get_storyline_date(user, utils_service.make_date_from(api_date))
+            summary = moves_service.get_summary_date(user, utils_service.make_date_from(api_date))
         else:
             summary = moves_service.get_summary_past_days(user, int(dayspie))
 
-        distances = {'walking':0, 'cycling':0, 'running':0, 'transport':0}
-
-        # get labels and data for the pie
-        for key in distances:
-            for segments in summary:
-                for element in segments['summary']:
-                    if element['activity'] == key:
-                        distances[key] += element['distance']
-
-        labels = [key for key, value in distances.items() if value > 0]
-        sizes = [v for k,v in distances.items() if k in labels]
-
-        # color map for coloring diagram-stuff
-        # ref: https://matplotlib.org/examples/color/colormaps_reference.html
-        #color_list = plt.cm.tab10(np.linspace(0, 1, 24))
-
-        # init figure & canvas
-        plt.close()
-        fig = plt.figure(figsize=(3,4))
-        fig.patch.set_alpha(0)
-        canvas = FigureCanvas(fig)
-
-        # get the colors (wtf ...)
-        cols = [utils_service.get_activity_color(label) for label in labels]
-
-        # draw the legend by hand, because display looks shitty for small values (even more wtf ...)
-        y = -1.5
-        whole = sum(sizes)
-
-        for key in distances.items():
-            if key[1] > 0:
-                col = utils_service.get_activity_color(key[0])
-                legend_activity = str(key[0]) + ": " + str(round(key[1]/(whole/100),2)) + "%"
-                plt.text(0.2, y, legend_activity, va='top', ha='right', rotation=0, wrap=True, color=col)
-            y+=0.13
-
-        # set pie config
-        plt.pie(sizes, labels=None, autopct=None, shadow=True, startangle=90, colors=cols, center=(-0.8,0))
-
-        # misc settings
-        plt.subplots_adjust(top=0.3, bottom=0.25)
-        plt.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-        plt.tight_layout()
-        #plt.legend()
-
-        plt.plot(transparent=True)
-
-        # prepare the response, setting Content-Type
-        response = HttpResponse(content_type='image/svg+xml')
-        # print the image on the response
-        canvas.print_figure(response, format='svg')
-        # and return it
-        return response
+        return chart_service.pie_distances(summary)
+
+    def render_svg(self, user, datepie, dayspie):
+        return chart_service.render('pie', self.get_distances(user, datepie, dayspie))
+
+
+class UserActivityPieChartView(UserActivityMplPieView):
+    """returns the distance per activity of the pie chart as json"""
+    def get(self, request, datepie=None, dayspie=10, *args, **kwargs):
+        user = User.objects.get(username=request.user.username)
+        return self.cached_json(request, user, 'pie.json', [datepie, dayspie],
+                                lambda: dict(activities=self.get_distances(user, datepie, dayspie)))
 
 
-class UserActivityDetailMapView(LoginRequiredMixin, View):
+class UserActivityDetailMapView(LoginRequiredMixin, SimplifyMixin, View):
     @never_cache
     def get(self, request, date, index, *args, **kwargs):
         user = User.objects.get(username=request.user.username)
@@ -460,7 +503,7 @@ class UserActivityDetailMapView(LoginRequiredMixin, View):
         utils_service.validate_date(api_date)
         activity = moves_service.get_activity_date(user, utils_service.make_date_from(api_date), int(index))
         features = []
-        geojson = utils_service.geojson_activity(activity)
+        geojson = utils_service.geojson_activity(activity, **self.simplify_params(request))
         features.append(geojson)
         geojson = {'type': 'FeatureCollection', 'features': features}
         return HttpResponse(json.dumps(geojson),  content_type='application/geo+json')